@@ -66,12 +66,28 @@ def compare(parent):
         slot=parent.compare_folder)
 
 
+def find_duplicates(parent):
+    """Find duplicate and near-duplicate images."""
+    return new_action(parent, 'Find Duplicates', slot=parent.find_duplicates)
+
+
+def export_crops(parent):
+    """Export the selected crop of all the images."""
+    return new_action(parent, 'Export Crops', slot=parent.export_crops)
+
+
 def history(parent):
     """History."""
     return new_action(
         parent, 'History', icon_name='history.png', slot=parent.open_history)
 
 
+def recursive(parent):
+    """Recursive folder mode."""
+    return new_action(
+        parent, 'Recursive', slot=parent.toggle_recursive, checkable=True)
+
+
 def exclude_file_name(parent):
     """Exclude file name."""
     return new_action(
@@ -90,6 +106,71 @@ def include_file_name(parent):
         slot=parent.include_file_name)
 
 
+def playback(parent):
+    """Play the image list as frames."""
+    return new_action(parent, 'Play', slot=parent.toggle_playback)
+
+
+def set_playback_fps(parent):
+    """Set the target FPS of playback."""
+    return new_action(parent, 'Playback FPS', slot=parent.set_playback_fps)
+
+
+def diff_heatmap(parent):
+    """Show |main - comparison| as a heatmap."""
+    return new_action(
+        parent,
+        'Difference Heatmap',
+        slot=parent.toggle_diff_heatmap,
+        checkable=True)
+
+
+def set_diff_amplification(parent):
+    """Set the amplification of the difference heatmap."""
+    return new_action(
+        parent, 'Heatmap Amplification', slot=parent.set_diff_amplification)
+
+
+def pixel_values(parent):
+    """Draw the value inside each visible pixel at high zoom."""
+    return new_action(
+        parent,
+        'Pixel Values',
+        slot=parent.toggle_pixel_values,
+        checkable=True)
+
+
+def play_frames(parent):
+    """Play the frames of an animated GIF or multi-page TIFF."""
+    return new_action(parent, 'Play Frames', slot=parent.toggle_animation)
+
+
+def mosaic(parent):
+    """Synchronized mosaic of comparison folders."""
+    return new_action(
+        parent, 'Mosaic', slot=parent.toggle_mosaic, checkable=True)
+
+
+def lean_memory(parent):
+    """Keep only one pixel buffer for each shown image."""
+    return new_action(
+        parent, 'Lean Memory', slot=parent.toggle_lean_memory, checkable=True)
+
+
+def process_decoding(parent):
+    """Decode images on a process pool."""
+    return new_action(
+        parent,
+        'Process Decoding',
+        slot=parent.toggle_process_decoding,
+        checkable=True)
+
+
+def sort_by_meta(parent):
+    """Sort by metadata."""
+    return new_action(parent, 'Sort', slot=parent.sort_by_meta)
+
+
 def show_instruction_msg(parent):
     return new_action(
         parent,
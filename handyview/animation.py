@@ -0,0 +1,264 @@
+"""
+Frame navigation and playback of animated GIF/WebP and multi-page TIFF.
+
+GIF frames depend on the earlier frames, so the image is kept open and
+decoded incrementally: stepping forward only decodes the new frame. Decoded
+frames are kept in a bounded cache, so that seeking back does not decode
+from frame 0 again.
+"""
+import threading
+import time
+from archive import open_key
+from concurrent.futures import ThreadPoolExecutor
+from decoders import PILDecoder, array_to_qimage, get_ext
+from image_cache import ImageCache
+from PIL import Image
+from PyQt5 import QtCore
+
+ANIMATED_EXTENSIONS = ('.gif', '.webp', '.apng', '.tif', '.tiff')
+
+
+class FrameReader:
+    """Random access to the frames of an animated or multi-page image.
+
+    Seeking backward to a frame that is not cached re-decodes the sequential
+    formats (GIF, WebP) from frame 0, and all the frames on the way are
+    cached. TIFF pages are independent and are decoded directly.
+
+    Args:
+        key (str): Image path or archive key.
+        max_cache_bytes (int): Max bytes of the cached frames.
+            Default: 256 MB.
+    """
+
+    def __init__(self, key, max_cache_bytes=256 * 1024 * 1024):
+        self.key = key
+        self.file = open_key(key, read_ahead=True)
+        try:
+            self.img = Image.open(self.file)
+            self.num_frames = getattr(self.img, 'n_frames', 1)
+        except Exception:
+            self.file.close()
+            raise
+        self.sequential = self.img.format != 'TIFF'
+        # frame index -> duration in ms, None for pages without durations
+        self.durations = {}
+        self.cache = ImageCache(max_cache_bytes)
+        # index of the frame loaded in self.img
+        self.pos = -1
+        # the PIL image is not thread-safe
+        self.lock = threading.Lock()
+
+    def get(self, idx):
+        """Get a decoded frame.
+
+        Returns:
+            QImage: Frame.
+        """
+        qimg = self.cache.get(idx)
+        if qimg is not None:
+            return qimg
+        with self.lock:
+            qimg = self.cache.get(idx)
+            if qimg is not None:
+                return qimg
+            start = idx
+            if self.sequential:
+                start = self.pos + 1 if self.pos < idx else 0
+            for frame_idx in range(start, idx + 1):
+                qimg = self._decode(frame_idx)
+            return qimg
+
+    def _decode(self, idx):
+        self.img.seek(idx)
+        self.pos = idx
+        self.durations[idx] = self.img.info.get('duration')
+        qimg = array_to_qimage(PILDecoder.to_array(self.img))
+        self.cache.put(idx, qimg)
+        return qimg
+
+    def close(self):
+        with self.lock:
+            self.img.close()
+            self.file.close()
+            self.cache.clear()
+
+
+class AnimationPlayer(QtCore.QObject):
+    """Frame navigation and playback of the image shown in a canvas.
+
+    Frames are decoded ahead in a background thread, and shown at their
+    native durations. Pages without durations (e.g., TIFF) are shown at the
+    playback FPS of the canvas.
+
+    Args:
+        canvas (Canvas): The canvas to show frames.
+        read_ahead (int): Number of frames decoded ahead in playback.
+            Default: 8.
+        max_cache_bytes (int): Max bytes of the cached frames.
+            Default: 256 MB.
+    """
+    # frame index
+    decoded = QtCore.pyqtSignal(int)
+
+    def __init__(self,
+                 canvas,
+                 read_ahead=8,
+                 max_cache_bytes=256 * 1024 * 1024):
+        super(AnimationPlayer, self).__init__(canvas)
+        self.canvas = canvas
+        self.read_ahead = read_ahead
+        self.max_cache_bytes = max_cache_bytes
+        self.key = None
+        self.reader = None
+        self.frame_idx = 0
+        # one worker, the reader decodes one frame at a time
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = set()
+        self.waiting_idx = None
+        # when the next frame is due, None when stopped
+        self.next_time = None
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.decoded.connect(self.on_decoded)
+
+    @property
+    def num_frames(self):
+        return 1 if self.reader is None else self.reader.num_frames
+
+    @property
+    def playing(self):
+        return self.next_time is not None
+
+    @property
+    def resident_images(self):
+        """The cached frames."""
+        return [] if self.reader is None else self.reader.cache.cached_images
+
+    def open(self, key):
+        """Open the frames of an image.
+
+        Single-frame images have no reader. None only closes the current
+        reader.
+        """
+        if key == self.key:
+            return
+        self.stop()
+        if self.reader is not None:
+            # close it after the pending decoding
+            self.executor.submit(self.reader.close)
+        self.key = key
+        self.reader = None
+        self.frame_idx = 0
+        self.pending.clear()
+        if key is None or get_ext(key) not in ANIMATED_EXTENSIONS:
+            return
+        try:
+            reader = FrameReader(key, self.max_cache_bytes)
+        except Exception:
+            # let the normal decoding report the broken image
+            return
+        if reader.num_frames > 1:
+            self.reader = reader
+        else:
+            reader.close()
+
+    def current_frame(self):
+        """Get the current frame, None for single-frame images."""
+        if self.reader is None:
+            return None
+        try:
+            return self.reader.get(self.frame_idx)
+        except Exception:
+            return None
+
+    def step(self, step):
+        """Show the previous (step < 0) or the next (step > 0) frame."""
+        if self.reader is None:
+            return
+        self.stop()
+        self.frame_idx = (self.frame_idx + step) % self.num_frames
+        qimg = self.current_frame()
+        if qimg is not None:
+            self.canvas.show_image(qimg=qimg)
+
+    def toggle(self):
+        if self.playing:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        if self.reader is None or self.canvas.mosaic_mode:
+            return
+        self.next_time = time.perf_counter() + self.get_duration(
+            self.frame_idx)
+        self.decode_ahead()
+        self.schedule()
+
+    def stop(self):
+        self.timer.stop()
+        self.next_time = None
+        self.waiting_idx = None
+
+    def get_duration(self, idx):
+        """Get the duration of a frame in seconds."""
+        duration = self.reader.durations.get(idx)
+        if duration is None:
+            return 1 / self.canvas.player.fps
+        # like browsers, very short GIF durations are shown at 10 FPS
+        if duration <= 10:
+            duration = 100
+        return duration / 1000
+
+    def schedule(self):
+        delay = self.next_time - time.perf_counter()
+        self.timer.start(max(0, int(delay * 1000)))
+
+    def tick(self):
+        if self.reader is None or self.canvas.mosaic_mode:
+            self.stop()
+            return
+        idx = (self.frame_idx + 1) % self.num_frames
+        qimg = self.reader.cache.get(idx)
+        if qimg is None:
+            # not decoded in time, show it once it is decoded
+            self.waiting_idx = idx
+            self.decode_ahead()
+            return
+        self.frame_idx = idx
+        self.canvas.show_image(qimg=qimg)
+        # keep the native frame rate, a late frame shortens the next one,
+        # but a long stall is not caught up
+        self.next_time = max(self.next_time + self.get_duration(idx),
+                             time.perf_counter())
+        self.decode_ahead()
+        self.schedule()
+
+    def on_decoded(self, idx):
+        if self.playing and idx == self.waiting_idx:
+            self.waiting_idx = None
+            self.tick()
+
+    def decode_ahead(self):
+        for i in range(1, self.read_ahead + 1):
+            idx = (self.frame_idx + i) % self.num_frames
+            if idx in self.pending or self.reader.cache.get(idx) is not None:
+                continue
+            self.pending.add(idx)
+            self.executor.submit(self.decode, self.reader, idx)
+
+    def decode(self, reader, idx):
+        if reader is not self.reader:
+            # another image is opened
+            return
+        try:
+            reader.get(idx)
+        except Exception:
+            return
+        finally:
+            self.pending.discard(idx)
+        self.decoded.emit(idx)
@@ -0,0 +1,314 @@
+"""
+Browse images inside zip/tar archives without extracting them.
+
+An image inside an archive is addressed by a key of the form
+``<archive path>::<member name>``, for example,
+``datasets/shard_000.tar::train/0001.png``.
+
+Note that random access into compressed tar files (.tar.gz, etc) has to
+decompress from the beginning of the stream. Use zip or plain tar for large
+shards.
+"""
+import io
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils import is_image_file, natural_sort_key
+
+ARCHIVE_SEP = '::'
+ARCHIVE_FORMATS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                   '.tar.xz', '.txz')
+
+# opened archive readers, indexed by archive path
+_READERS = {}
+
+
+def is_archive(path):
+    """Whether the path is a supported archive file."""
+    return path.lower().endswith(ARCHIVE_FORMATS) and os.path.isfile(path)
+
+
+def is_archive_key(key):
+    return ARCHIVE_SEP in key
+
+
+def split_key(key):
+    """Split a key into (archive path, member name).
+
+    For a normal file path, the archive path is None.
+    """
+    if ARCHIVE_SEP in key:
+        archive_path, member = key.split(ARCHIVE_SEP, 1)
+        return archive_path, member
+    return None, key
+
+
+def join_key(archive_path, member):
+    return f'{archive_path}{ARCHIVE_SEP}{member}'
+
+
+def get_reader(archive_path):
+    """Get the (cached) reader of an archive."""
+    archive_path = archive_path.replace('\\', '/')
+    if archive_path not in _READERS:
+        _READERS[archive_path] = ArchiveReader(archive_path)
+    return _READERS[archive_path]
+
+
+def get_cached_bytes():
+    """Bytes of the archive members kept in memory by all the readers."""
+    return sum(reader.cached_bytes for reader in _READERS.values())
+
+
+def read_bytes(key, read_ahead=False):
+    """Read the raw (encoded) bytes of an archive member.
+
+    Args:
+        key (str): Archive key.
+        read_ahead (bool): Whether it is a display decode, which is cached
+            and reads the next members ahead. Probes, hashes and thumbnails
+            read without them. Default: False.
+    """
+    archive_path, member = split_key(key)
+    return get_reader(archive_path).read(member, read_ahead)
+
+
+def get_size(key):
+    """Get the (uncompressed) file size of an archive member."""
+    archive_path, member = split_key(key)
+    return get_reader(archive_path).size(member)
+
+
+def get_stat(key):
+    """Get the file size and modification time of a key.
+
+    Returns:
+        tuple[int, float]: File size and mtime.
+    """
+    if is_archive_key(key):
+        archive_path, member = split_key(key)
+        reader = get_reader(archive_path)
+        return reader.size(member), reader.mtime(member)
+    stat = os.stat(key)
+    return stat.st_size, stat.st_mtime
+
+
+def open_key(key, read_ahead=False):
+    """Open a key as a file object, which can be passed to PIL.Image.open.
+
+    Args:
+        key (str): Image path or archive key.
+        read_ahead (bool): Whether it is a display decode, see read_bytes.
+            Default: False.
+    """
+    if is_archive_key(key):
+        return io.BytesIO(read_bytes(key, read_ahead))
+    return open(key, 'rb')
+
+
+class ArchiveReader:
+    """Random access reader for the images inside a zip/tar archive.
+
+    The member index is built only once when opening the archive. Members are
+    read on demand, and the next few members (along the browsing direction)
+    are read ahead in a background thread. The read-ahead thread has its own
+    archive handle, so that reading a member on demand never waits behind
+    the read-ahead I/O.
+
+    Only display decodes are cached and read ahead. Other reads (e.g., header
+    probes and hashes from the worker threads) neither change the browsing
+    direction nor evict the members read ahead.
+
+    Args:
+        archive_path (str): Path to the archive.
+        read_ahead (int): Number of members to read ahead. Default: 3.
+        cache_size (int): Max number of members kept in memory. Default: 8.
+    """
+
+    def __init__(self, archive_path, read_ahead=3, cache_size=8):
+        self.archive_path = archive_path
+        self.read_ahead = read_ahead
+        self.cache_size = cache_size
+
+        # guard the cache and the pending read-ahead
+        self._lock = threading.Lock()
+        # archive handles are not thread-safe, guard the on-demand reads
+        self._read_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # member name -> bytes
+        self._cache = OrderedDict()
+        # member name -> Future of the read-ahead, queued or in flight
+        self._pending = {}
+        self._last_idx = None
+        # opened in the read-ahead thread, only used there
+        self._ahead_handle = None
+
+        self._is_zip = zipfile.is_zipfile(archive_path)
+        self._handle = self._open_handle()
+        if self._is_zip:
+            infos = {
+                info.filename: info
+                for info in self._handle.infolist() if not info.is_dir()
+            }
+            self._sizes = {
+                name: info.file_size
+                for name, info in infos.items()
+            }
+        else:
+            # TarInfo records the data offset, so that members can be
+            # extracted without scanning the archive again
+            infos = {
+                info.name: info
+                for info in self._handle.getmembers() if info.isfile()
+            }
+            self._sizes = {name: info.size for name, info in infos.items()}
+        self._infos = infos
+
+        # the index of image members, with natural sort
+        self.members = sorted((name for name in infos if is_image_file(name)),
+                              key=natural_sort_key)
+        self._member_idx = {name: i for i, name in enumerate(self.members)}
+
+    def get_img_list(self, img_filter=None):
+        """Get the image key list of this archive.
+
+        It only uses the cached member index and never touches the archive.
+
+        Args:
+            img_filter (ImageFilter): Filter by names. Default: None.
+        """
+        img_list = [
+            join_key(self.archive_path, member) for member in self.members
+        ]
+        if img_filter is not None:
+            img_list = [key for key in img_list if img_filter.match_name(key)]
+        return img_list
+
+    def size(self, member):
+        return self._sizes[member]
+
+    def mtime(self, member):
+        info = self._infos[member]
+        if self._is_zip:
+            return time.mktime(info.date_time + (0, 0, -1))
+        return float(info.mtime)
+
+    def read(self, member, read_ahead=False):
+        """Read a member.
+
+        Args:
+            member (str): Member name.
+            read_ahead (bool): Whether to cache the member and read the next
+                members ahead, for display decodes. Default: False.
+
+        Returns:
+            bytes: Member bytes.
+        """
+        data = self._get_cached(member)
+        if not read_ahead:
+            if data is None:
+                with self._read_lock:
+                    data = self._read_member(self._handle, member)
+            return data
+        if data is None:
+            data = self._load(member)
+        self._read_ahead(member)
+        return data
+
+    def _get_cached(self, member):
+        with self._lock:
+            if member in self._cache:
+                self._cache.move_to_end(member)
+                return self._cache[member]
+        return None
+
+    def _open_handle(self):
+        if self._is_zip:
+            return zipfile.ZipFile(self.archive_path)
+        return tarfile.open(self.archive_path)
+
+    def _read_member(self, handle, member):
+        # ZipInfo and TarInfo can be used with any handle of the archive
+        if self._is_zip:
+            return handle.read(self._infos[member])
+        with handle.extractfile(self._infos[member]) as f:
+            return f.read()
+
+    def _put(self, member, data):
+        """Put a member into the cache. The lock must be held."""
+        self._cache[member] = data
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _load(self, member):
+        """Read a member on demand."""
+        with self._lock:
+            if member in self._cache:
+                return self._cache[member]
+            future = self._pending.get(member)
+        # wait for the read-ahead in flight, or read it here if it is still
+        # queued
+        if future is not None:
+            if future.cancel():
+                with self._lock:
+                    self._pending.pop(member, None)
+            else:
+                try:
+                    return future.result()
+                except Exception:
+                    pass
+        with self._read_lock:
+            data = self._read_member(self._handle, member)
+        with self._lock:
+            self._put(member, data)
+        return data
+
+    def _load_ahead(self, member):
+        """Read a member ahead, in the read-ahead thread."""
+        try:
+            if self._ahead_handle is None:
+                self._ahead_handle = self._open_handle()
+            data = self._read_member(self._ahead_handle, member)
+        except Exception:
+            with self._lock:
+                self._pending.pop(member, None)
+            raise
+        with self._lock:
+            self._put(member, data)
+            self._pending.pop(member, None)
+        return data
+
+    @property
+    def cached_bytes(self):
+        """Bytes of the members kept in memory."""
+        with self._lock:
+            return sum(len(data) for data in self._cache.values())
+
+    def _read_ahead(self, member):
+        idx = self._member_idx.get(member)
+        if idx is None:
+            return
+        # read ahead along the browsing direction
+        step = -1 if (self._last_idx is not None
+                      and idx < self._last_idx) else 1
+        self._last_idx = idx
+        next_members = [
+            self.members[(idx + step * i) % len(self.members)]
+            for i in range(1,
+                           min(self.read_ahead, self.cache_size - 1) + 1)
+        ]
+        with self._lock:
+            # drop the queued read-ahead that is not needed any more, e.g.,
+            # after a jump
+            for name, future in list(self._pending.items()):
+                if name not in next_members and future.cancel():
+                    del self._pending[name]
+            for next_member in next_members:
+                if (next_member not in self._cache
+                        and next_member not in self._pending):
+                    self._pending[next_member] = self._executor.submit(
+                        self._load_ahead, next_member)
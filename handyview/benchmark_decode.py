@@ -0,0 +1,117 @@
+"""
+Benchmark decoding in threads (load_qimage) against decoding on a process
+pool with shared memory transfer (ProcessDecoder).
+
+Usage:
+    python handyview/benchmark_decode.py [--folder FOLDER] [--num_workers N]
+
+Without a folder, synthetic images are written for each format in
+BENCH_FORMATS.
+"""
+import argparse
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decoders import load_qimage
+from PIL import Image
+from process_decoder import ProcessDecoder
+from utils import is_image_file, natural_sort_key
+
+# common formats that PIL can write
+BENCH_FORMATS = ('.jpg', '.png', '.ppm', '.bmp', '.gif', '.tiff', '.webp')
+
+
+def make_synthetic_images(folder, size, num_images):
+    """Write synthetic images (gradient with noise) for each format.
+
+    Returns:
+        dict: {extension: list of image paths}.
+    """
+    height, width = size
+    rng = np.random.default_rng(0)
+    grid_y, grid_x = np.mgrid[0:height, 0:width]
+    img_lists = OrderedDict()
+    for ext in BENCH_FORMATS:
+        img_lists[ext] = []
+        for idx in range(num_images):
+            noise = rng.integers(0, 32, (height, width, 3))
+            pixels = np.stack(
+                [grid_x % 256, grid_y % 256, (grid_x + grid_y + idx) % 256],
+                axis=2)
+            pixels = np.clip(pixels + noise, 0, 255).astype(np.uint8)
+            img = Image.fromarray(pixels)
+            if ext == '.gif':
+                img = img.convert('P')
+            path = os.path.join(folder, f'{idx:04d}{ext}')
+            img.save(path)
+            img_lists[ext].append(path)
+    return img_lists
+
+
+def get_folder_images(folder):
+    """Get images in a folder, grouped by extension."""
+    img_lists = OrderedDict()
+    for name in sorted(os.listdir(folder), key=natural_sort_key):
+        if is_image_file(name):
+            ext = os.path.splitext(name)[1].lower()
+            img_lists.setdefault(ext, []).append(os.path.join(folder, name))
+    return img_lists
+
+
+def bench_threads(img_list, num_workers):
+    tic = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for qimg in executor.map(load_qimage, img_list):
+            assert not qimg.isNull()
+    return time.perf_counter() - tic
+
+
+def bench_processes(img_list, decoder):
+    tic = time.perf_counter()
+    futures = [decoder.submit(key) for key in img_list]
+    for future in futures:
+        assert not future.result().isNull()
+    return time.perf_counter() - tic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--folder', type=str, default=None)
+    parser.add_argument('--num_workers', type=int, default=os.cpu_count())
+    parser.add_argument('--num_images', type=int, default=32)
+    parser.add_argument('--size', type=int, nargs=2, default=[1080, 1920])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        if args.folder is None:
+            print(f'Writing {args.num_images} synthetic images of '
+                  f'{args.size[0]}x{args.size[1]} for each format ...')
+            img_lists = make_synthetic_images(tmp_folder, args.size,
+                                              args.num_images)
+        else:
+            img_lists = get_folder_images(args.folder)
+        if not img_lists:
+            print('No image found.')
+            sys.exit(1)
+
+        decoder = ProcessDecoder(args.num_workers)
+        # start the worker processes before timing
+        bench_processes(
+            next(iter(img_lists.values()))[:args.num_workers], decoder)
+        print(f'Workers: {args.num_workers}')
+        print(f'{"format":<8}{"images":>8}{"threads (s)":>14}'
+              f'{"processes (s)":>16}{"speedup":>10}')
+        for ext, img_list in img_lists.items():
+            thread_time = bench_threads(img_list, args.num_workers)
+            process_time = bench_processes(img_list, decoder)
+            print(f'{ext:<8}{len(img_list):>8d}{thread_time:>14.3f}'
+                  f'{process_time:>16.3f}{thread_time / process_time:>9.2f}x')
+        decoder.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+On-disk caches shared by the viewer and the offline pre-indexer.
+
+Each folder (or archive) has a directory index file, which records per-image
+entries (e.g., header metadata and thumbnails). An entry is only valid when
+the file size and mtime are unchanged. The index of a folder also records its
+sorted listing, which is valid while the folder mtime is unchanged.
+"""
+import hashlib
+import json
+import os
+import threading
+from archive import split_key
+
+CACHE_ROOT = os.environ.get(
+    'HANDYVIEW_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'handyview'))
+
+# opened directory indexes, indexed by folder
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_cache_path(kind, folder, ext='.json'):
+    """Get the cache file path of a folder.
+
+    Args:
+        kind (str): Cache kind, used as the sub-folder name, e.g., 'index'.
+        folder (str): Image folder or archive.
+        ext (str): Extension of the cache file. Default: '.json'.
+    """
+    digest = hashlib.sha1(os.path.abspath(folder).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_ROOT, kind, f'{digest}{ext}')
+
+
+def split_folder(key):
+    """Split a key into (folder, name) used by the directory index.
+
+    For an archive member, the folder is the archive path.
+    """
+    archive_path, member = split_key(key)
+    if archive_path is not None:
+        return archive_path, member
+    return os.path.split(key)
+
+
+def get_dir_index(folder):
+    # different spellings of a folder (e.g., with a trailing slash) share
+    # the same index file, so they must share the same index
+    abs_folder = os.path.abspath(folder)
+    with _INDEXES_LOCK:
+        if abs_folder not in _INDEXES:
+            _INDEXES[abs_folder] = DirIndex(folder)
+        return _INDEXES[abs_folder]
+
+
+def save_dir_indexes():
+    """Save all the modified directory indexes."""
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+    for index in indexes:
+        index.save()
+
+
+class DirIndex:
+    """Directory index of a folder, persisted in the cache folder.
+
+    Args:
+        folder (str): Image folder or archive.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = get_cache_path('index', folder)
+        self.lock = threading.Lock()
+        self.dirty = False
+        # name -> entry dict with 'size', 'mtime' and cached fields
+        self.entries = {}
+        # dict with the folder 'mtime', file 'names' and sub-folder 'dirs'
+        self.listing = None
+        try:
+            with open(self.path, 'r') as f:
+                content = json.load(f)
+            self.entries = content['entries']
+            self.listing = content.get('listing')
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def get(self, name, field, stat):
+        """Get a cached field of an image.
+
+        Args:
+            name (str): Image name in this folder.
+            field (str): Field name, e.g., 'meta'.
+            stat (tuple[int, float]): Current file size and mtime.
+
+        Returns:
+            The cached value. None if it is missing or out of date.
+        """
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or (entry['size'], entry['mtime']) != tuple(stat):
+                return None
+            return entry.get(field)
+
+    def set(self, name, field, value, stat):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or (entry['size'], entry['mtime']) != tuple(stat):
+                # the file has been changed, drop all the old fields
+                entry = {'size': stat[0], 'mtime': stat[1]}
+                self.entries[name] = entry
+            entry[field] = value
+            self.dirty = True
+
+    def get_listing(self, mtime):
+        """Get the cached listing of the folder.
+
+        Args:
+            mtime (float): Current mtime of the folder.
+
+        Returns:
+            tuple[list[str], list[str]] | None: File names (all the files,
+                not only images) and sub-folder names, both with natural
+                sort. None if it is missing or out of date.
+        """
+        with self.lock:
+            # listings of older versions only have the image names
+            if (self.listing is None or 'names' not in self.listing
+                    or self.listing['mtime'] != mtime):
+                return None
+            return self.listing['names'], self.listing['dirs']
+
+    def set_listing(self, names, dirs, mtime):
+        with self.lock:
+            self.listing = {'mtime': mtime, 'names': names, 'dirs': dirs}
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            content = {
+                'folder': self.folder,
+                'listing': self.listing,
+                'entries': self.entries
+            }
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # write to a temp file first, so that the index is never broken
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(content, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
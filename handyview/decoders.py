@@ -0,0 +1,513 @@
+"""
+Decoder registry.
+
+Each decoder plugin declares its file extensions, its outputs and its
+capabilities:
+    - outputs: 'qimage' for showing and 'pil' for processing (e.g., hashes
+        and crops).
+    - capabilities: 'probe' (header-only size and mode), 'reduced'
+        (reduced-resolution decode), 'region' (decode only a region) and
+        'high_bit_depth' (keep 16-bit and float pixels in the 'pil'
+        output).
+
+Each request picks the cheapest decoder that supports the extension, the
+output and the needed capabilities, and falls back to the next one when it
+fails. Decoders with a lower cost are tried first.
+
+New decoders can be added by:
+    register_decoder(MyDecoder())
+"""
+import numpy as np
+import os
+import struct
+from archive import is_archive_key, open_key, read_bytes, split_key
+from PIL import Image
+from PyQt5.QtCore import QBuffer, QByteArray, QRect, QSize
+from PyQt5.QtGui import QImage, QImageReader
+from utils import IMG_EXTENSIONS
+
+try:
+    # OpenEXR is disabled by default in OpenCV
+    os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
+    import cv2
+except ImportError:
+    cv2 = None
+
+CAPABILITIES = ('probe', 'reduced', 'region', 'high_bit_depth')
+
+# registered decoders, sorted by cost
+DECODERS = []
+
+
+def get_ext(key):
+    """Get the lower-case extension of a file path or an archive key."""
+    return os.path.splitext(split_key(key)[1])[1].lower()
+
+
+def register_decoder(decoder):
+    """Register a decoder instance, and its extensions for image listing."""
+    DECODERS.append(decoder)
+    DECODERS.sort(key=lambda d: d.cost)
+    IMG_EXTENSIONS.update(decoder.extensions)
+    return decoder
+
+
+def get_decoders(key, output='qimage', needs=()):
+    """Get decoders for a key, from the cheapest.
+
+    Args:
+        key (str): Image path or archive key.
+        output (str | None): 'qimage', 'pil' or None for any.
+            Default: 'qimage'.
+        needs (tuple[str]): Needed capabilities. Default: ().
+
+    Returns:
+        list[Decoder]: Decoders that satisfy the request.
+    """
+    ext = get_ext(key)
+    return [
+        decoder for decoder in DECODERS if ext in decoder.extensions and (
+            output is None or output in decoder.outputs) and all(
+                need in decoder.capabilities for need in needs)
+    ]
+
+
+def _run(key, output, needs, func):
+    """Try the decoders one by one, and raise the last error."""
+    decoders = get_decoders(key, output, needs)
+    if not decoders:
+        raise ValueError(f'No decoder for {key} with output {output} and '
+                         f'capabilities {needs}.')
+    for decoder in decoders:
+        try:
+            return func(decoder)
+        except Exception as error:
+            last_error = error
+    raise last_error
+
+
+def probe(key):
+    """Probe the size and mode of an image from its header.
+
+    Returns:
+        dict: {'width': int, 'height': int, 'mode': PIL mode str}.
+    """
+    return _run(key, None, ('probe', ), lambda decoder: decoder.probe(key))
+
+
+def load_qimage(key, size=None, box=None):
+    """Decode a key (file path or archive member) to QImage for showing.
+
+    It is safe to be called in worker threads.
+
+    Args:
+        key (str): Image path or archive key.
+        size (int): Decode at a reduced resolution whose longer side is at
+            least size. Default: None (full resolution).
+        box (tuple[int]): Only decode the region (left, top, right, bottom).
+            Default: None.
+
+    Returns:
+        QImage: Decoded image. A null QImage if it cannot be decoded.
+    """
+    needs = _get_needs(size, box)
+    try:
+        return _run(key, 'qimage', needs,
+                    lambda decoder: decoder.decode_qimage(key, size, box))
+    except Exception:
+        return QImage()
+
+
+def load_image(key, size=None, box=None, high_bit_depth=False):
+    """Decode a key to a PIL image for processing.
+
+    Args:
+        key (str): Image path or archive key.
+        size (int): Decode at a reduced resolution whose longer side is at
+            least size. Default: None (full resolution).
+        box (tuple[int]): Only decode the region (left, top, right, bottom).
+            Default: None.
+        high_bit_depth (bool): Keep 16-bit and float pixels. Otherwise,
+            they may be converted to 8 bits. Default: False.
+
+    Returns:
+        PIL.Image: Decoded image.
+    """
+    needs = _get_needs(size, box, high_bit_depth)
+    return _run(key, 'pil', needs,
+                lambda decoder: decoder.decode_pil(key, size, box))
+
+
+def _get_needs(size=None, box=None, high_bit_depth=False):
+    needs = []
+    if size is not None:
+        needs.append('reduced')
+    if box is not None:
+        needs.append('region')
+    if high_bit_depth:
+        needs.append('high_bit_depth')
+    return tuple(needs)
+
+
+def array_to_qimage(arr):
+    """Convert an array (uint8, uint16 or float in [0, 1]) to an 8-bit
+    QImage. Channels are in RGB(A) order."""
+    if arr.dtype == np.uint16:
+        arr = (arr >> 8).astype(np.uint8)
+    elif arr.dtype.kind in 'iu' and arr.dtype != np.uint8:
+        arr = (np.clip(arr, 0, 65535) >> 8).astype(np.uint8)
+    elif arr.dtype.kind == 'f':
+        arr = (np.clip(arr, 0, 1) * 255 + 0.5).astype(np.uint8)
+    if arr.ndim == 3 and arr.shape[2] == 1:
+        arr = arr[..., 0]
+    arr = np.ascontiguousarray(arr)
+    height, width = arr.shape[:2]
+    if arr.ndim == 2:
+        qimage_format = QImage.Format_Grayscale8
+    elif arr.shape[2] == 3:
+        qimage_format = QImage.Format_RGB888
+    else:
+        qimage_format = QImage.Format_RGBA8888
+    return QImage(arr.data, width, height, arr.strides[0],
+                  qimage_format).copy()
+
+
+class Decoder:
+    """Base class of decoders.
+
+    Attributes:
+        name (str): Decoder name.
+        extensions (tuple[str]): Lower-case file extensions.
+        outputs (tuple[str]): Supported outputs in 'qimage' and 'pil'.
+        capabilities (tuple[str]): Supported capabilities in CAPABILITIES.
+        cost (int): Relative cost. Cheaper decoders are tried first.
+    """
+    name = ''
+    extensions = ()
+    outputs = ()
+    capabilities = ()
+    cost = 0
+
+    def probe(self, key):
+        raise NotImplementedError
+
+    def decode_qimage(self, key, size=None, box=None):
+        raise NotImplementedError
+
+    def decode_pil(self, key, size=None, box=None):
+        raise NotImplementedError
+
+
+# QImage formats to PIL modes
+_QIMAGE_MODES = {
+    QImage.Format_Mono: '1',
+    QImage.Format_MonoLSB: '1',
+    QImage.Format_Indexed8: 'P',
+    QImage.Format_Grayscale8: 'L',
+    QImage.Format_RGB32: 'RGB',
+    QImage.Format_RGB888: 'RGB',
+    QImage.Format_ARGB32: 'RGBA',
+    QImage.Format_ARGB32_Premultiplied: 'RGBA',
+    QImage.Format_RGBA8888: 'RGBA'
+}
+# high bit depth formats, only in newer Qt versions
+_HIGH_BIT_DEPTH_MODES = {
+    'Format_Grayscale16': 'I;16',
+    'Format_RGBX64': 'RGB',
+    'Format_RGBA64': 'RGBA'
+}
+_QIMAGE_MODES.update({
+    getattr(QImage, name): mode
+    for name, mode in _HIGH_BIT_DEPTH_MODES.items() if hasattr(QImage, name)
+})
+
+
+def get_qimage_mode(qimg):
+    """Get the PIL mode of a decoded QImage, used when the header cannot be
+    probed."""
+    return _QIMAGE_MODES.get(qimg.format(), 'unknown')
+
+
+class QtDecoder(Decoder):
+    """Decoder with QImageReader, the fastest path to QImage.
+
+    JPEG is decoded at a reduced resolution natively with a scaled size.
+    It does not probe, since QImageReader only gives the format of the
+    decoded QImage (e.g., LA is RGBA, CMYK is RGB), not the mode of the
+    file.
+    """
+    name = 'qt'
+    outputs = ('qimage', )
+    capabilities = ('reduced', 'region')
+    cost = 1
+
+    def __init__(self):
+        self.extensions = tuple(
+            f'.{bytes(fmt).decode().lower()}'
+            for fmt in QImageReader.supportedImageFormats()
+            if bytes(fmt).decode().lower() not in ('svg', 'svgz', 'pdf'))
+
+    @staticmethod
+    def get_reader(key):
+        """Get a QImageReader. The buffer is returned to keep it alive."""
+        if is_archive_key(key):
+            buffer = QBuffer()
+            buffer.setData(QByteArray(read_bytes(key, read_ahead=True)))
+            buffer.open(QBuffer.ReadOnly)
+            reader = QImageReader(buffer)
+            return reader, buffer
+        return QImageReader(key), None
+
+    def decode_qimage(self, key, size=None, box=None):
+        reader, _ = self.get_reader(key)
+        width, height = reader.size().width(), reader.size().height()
+        if box is not None:
+            left, top, right, bottom = box
+            reader.setClipRect(QRect(left, top, right - left, bottom - top))
+            width, height = right - left, bottom - top
+        if size is not None and max(width, height) > size > 0:
+            scale = size / max(width, height)
+            reader.setScaledSize(
+                QSize(
+                    max(1, round(width * scale)), max(1,
+                                                      round(height * scale))))
+        qimg = reader.read()
+        if qimg.isNull():
+            raise OSError(f'Cannot decode {key}: {reader.errorString()}')
+        return qimg
+
+
+def _restrict_raw_rows(img, top, bottom):
+    """Restrict a single uncompressed tile to rows [top, bottom).
+
+    Returns:
+        bool: Whether it is restricted. If True, the image size becomes
+            (width, bottom - top).
+    """
+    codec, extents, offset, args = img.tile[0]
+    if codec != 'raw' or tuple(extents) != (0, 0) + img.size:
+        return False
+    if isinstance(args, str):
+        args = (args, 0, 1)
+    rawmode, stride, ystep = (tuple(args) + (0, 1))[:3]
+    if ystep not in (1, -1) or img.mode == '1':
+        return False
+    if stride == 0:
+        # bytes per pixel of the raw mode
+        stride = img.width * len(
+            Image.new(img.mode, (1, 1)).tobytes('raw', rawmode))
+    if ystep == 1:
+        offset += top * stride
+    else:
+        # bottom-up rows, e.g., BMP
+        offset += (img.height - bottom) * stride
+    width, height = img.width, bottom - top
+    img._size = (width, height)
+    img.tile = [(codec, (0, 0, width, height), offset, (rawmode, stride,
+                                                        ystep))]
+    return True
+
+
+def _decode_pil_region(f, img, box):
+    """Decode a region of an opened PIL image.
+
+    Only the needed part is decoded when the format allows:
+        - tiled or striped TIFF: only the tiles intersecting the region.
+        - uncompressed single-tile images (PPM, BMP, raw TIFF): only the rows
+            of the region.
+    Other formats are fully decoded and then cropped.
+    """
+    left, top, right, bottom = box
+    left, top = max(0, left), max(0, top)
+    right, bottom = min(img.width, right), min(img.height, bottom)
+    if right <= left or bottom <= top:
+        raise ValueError(f'Empty region {box}.')
+    box = (left, top, right, bottom)
+    try:
+        if len(img.tile) > 1:
+            img.tile = [
+                tile for tile in img.tile
+                if tile[1][0] < right and tile[1][2] > left
+                and tile[1][1] < bottom and tile[1][3] > top
+            ]
+        elif len(img.tile) == 1 and _restrict_raw_rows(img, top, bottom):
+            box = (left, 0, right, bottom - top)
+        img.load()
+    except Exception:
+        # fall back to decoding the whole image
+        f.seek(0)
+        with Image.open(f) as full_img:
+            full_img.load()
+            return full_img.crop((left, top, right, bottom))
+    return img.crop(box)
+
+
+class PILDecoder(Decoder):
+    """Decoder with PIL.
+
+    It covers more formats than Qt (e.g., TIFF variants, WebP, JPEG 2000),
+    keeps 16-bit pixels, and decodes regions of TIFF, PPM and BMP without
+    decoding the whole image.
+    """
+    name = 'pil'
+    outputs = ('qimage', 'pil')
+    capabilities = ('probe', 'reduced', 'region', 'high_bit_depth')
+    cost = 2
+
+    def __init__(self):
+        Image.init()
+        openable = {
+            ext
+            for ext, fmt in Image.registered_extensions().items()
+            if fmt in Image.OPEN
+        }
+        self.extensions = tuple(
+            ext for ext in ('.bmp', '.dib', '.gif', '.jpg', '.jpeg', '.jpe',
+                            '.jfif', '.png', '.apng', '.ppm', '.pgm', '.pbm',
+                            '.pnm', '.pfm', '.tif', '.tiff', '.webp', '.tga',
+                            '.ico', '.psd', '.dds', '.pcx', '.sgi', '.jp2',
+                            '.j2k', '.jpx', '.qoi', '.avif')
+            if ext in openable)
+
+    def probe(self, key):
+        # PIL only reads the header when opening, pixels are decoded lazily
+        with open_key(key) as f, Image.open(f) as lazy_img:
+            width, height = lazy_img.size
+            return dict(width=width, height=height, mode=lazy_img.mode)
+
+    def decode_pil(self, key, size=None, box=None, read_ahead=False):
+        with open_key(key, read_ahead) as f:
+            img = Image.open(f)
+            if box is not None:
+                return _decode_pil_region(f, img, box)
+            if size is not None:
+                # JPEG is decoded at a reduced resolution natively
+                img.draft(None, (size, size))
+            # pixels are kept in memory after loading
+            img.load()
+        return img
+
+    @staticmethod
+    def to_array(img):
+        """Convert a PIL image to an array of L, RGB(A) or high bit depth
+        gray pixels."""
+        if img.mode in ('1', 'P', 'PA', 'LA', 'CMYK', 'YCbCr', 'LAB', 'HSV'):
+            img = img.convert('RGBA' if 'A' in img.mode or 'transparency' in
+                              img.info else 'RGB')
+        return np.asarray(img)
+
+    def decode_qimage(self, key, size=None, box=None):
+        # only display decodes read the next archive members ahead
+        img = self.decode_pil(key, size, box, read_ahead=True)
+        return array_to_qimage(self.to_array(img))
+
+
+def _read_cstr(f):
+    """Read a null-terminated string from a file object."""
+    chars = bytearray()
+    while True:
+        char = f.read(1)
+        if not char:
+            raise ValueError('Unexpected end of the header.')
+        if char == b'\0':
+            return chars.decode('latin-1')
+        chars += char
+
+
+def probe_exr(f):
+    """Probe the size and channels of an OpenEXR image from its header.
+
+    Returns:
+        dict: {'width': int, 'height': int, 'mode': PIL mode str}.
+    """
+    magic, _ = struct.unpack('<ii', f.read(8))
+    if magic != 20000630:
+        raise ValueError('Not an OpenEXR file.')
+    width = height = None
+    channels = []
+    while True:
+        name = _read_cstr(f)
+        if not name:
+            break
+        _read_cstr(f)  # attribute type
+        size, = struct.unpack('<i', f.read(4))
+        value = f.read(size)
+        if name == 'dataWindow':
+            left, top, right, bottom = struct.unpack('<iiii', value[:16])
+            width, height = right - left + 1, bottom - top + 1
+        elif name == 'channels':
+            # null-terminated names, each followed by 16 bytes
+            pos = 0
+            while value[pos:pos + 1] not in (b'', b'\0'):
+                end = value.index(b'\0', pos)
+                channels.append(value[pos:end].decode('latin-1'))
+                pos = end + 17
+    if width is None:
+        raise ValueError('No dataWindow in the OpenEXR header.')
+    if 'A' in channels:
+        mode = 'RGBA'
+    elif {'R', 'G', 'B'} & set(channels):
+        mode = 'RGB'
+    else:
+        mode = 'F'
+    return dict(width=width, height=height, mode=mode)
+
+
+def probe_hdr(f):
+    """Probe the size of a Radiance HDR image from its header.
+
+    Returns:
+        dict: {'width': int, 'height': int, 'mode': PIL mode str}.
+    """
+    if not f.readline().startswith(b'#?'):
+        raise ValueError('Not a Radiance HDR file.')
+    # header lines end with an empty line, then the resolution string,
+    # e.g., '-Y 512 +X 768'
+    while f.readline().strip():
+        pass
+    tokens = f.readline().split()
+    sizes = {
+        axis[1:2]: int(value)
+        for axis, value in zip(tokens[::2], tokens[1::2])
+    }
+    return dict(width=sizes[b'X'], height=sizes[b'Y'], mode='RGB')
+
+
+class OpenCVDecoder(Decoder):
+    """Decoder with OpenCV for high dynamic range formats, e.g., OpenEXR.
+
+    Float pixels are tone mapped with gamma 2.2 for showing. OpenCV cannot
+    read the headers only, so they are parsed here for probing.
+    """
+    name = 'opencv'
+    extensions = ('.exr', '.hdr')
+    outputs = ('qimage', )
+    capabilities = ('probe', )
+    cost = 3
+
+    def probe(self, key):
+        with open_key(key) as f:
+            if get_ext(key) == '.exr':
+                return probe_exr(f)
+            return probe_hdr(f)
+
+    def decode_qimage(self, key, size=None, box=None):
+        if is_archive_key(key):
+            buf = np.frombuffer(read_bytes(key, read_ahead=True), np.uint8)
+            arr = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+        else:
+            arr = cv2.imread(key, cv2.IMREAD_UNCHANGED)
+        if arr is None:
+            raise OSError(f'Cannot decode {key}.')
+        if arr.ndim == 3:
+            # BGR(A) to RGB(A)
+            arr = arr[..., [2, 1, 0, 3][:arr.shape[2]]]
+        if arr.dtype.kind == 'f':
+            arr = np.clip(arr, 0, 1)**(1 / 2.2)
+        return array_to_qimage(arr)
+
+
+register_decoder(QtDecoder())
+register_decoder(PILDecoder())
+if cv2 is not None:
+    register_decoder(OpenCVDecoder())
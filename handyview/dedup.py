@@ -0,0 +1,236 @@
+"""
+Find duplicate and near-duplicate images with perceptual hashes.
+
+Hashes (aHash, dHash and pHash, 64 bits each) are computed on a process pool
+and cached in the directory index per path and mtime. Near-duplicate groups
+are found by searching a BK-tree with the Hamming distance, instead of
+comparing all the pairs.
+"""
+import numpy as np
+import threading
+from archive import get_stat
+from cache import get_dir_index, save_dir_indexes, split_folder
+from concurrent.futures import as_completed
+from decoders import load_image
+from PIL import Image
+from PyQt5 import QtCore
+from utils import new_process_pool
+
+HASH_TYPES = ('ahash', 'dhash', 'phash')
+
+
+def _dct_matrix(n):
+    """DCT-II matrix, so that the 2D DCT of x is D @ x @ D.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    mat = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    mat[0] /= np.sqrt(2)
+    return mat
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    return int(''.join('1' if b else '0' for b in bits.flatten()), 2)
+
+
+def compute_hashes(key):
+    """Compute aHash, dHash and pHash of an image.
+
+    Returns:
+        dict: {hash type: 64-bit int}.
+    """
+    # decode at a reduced resolution if possible, e.g., for JPEG
+    img = load_image(key, size=64).convert('L')
+    small = np.asarray(img.resize((8, 8), Image.BILINEAR), np.float32)
+    wide = np.asarray(img.resize((9, 8), Image.BILINEAR), np.float32)
+    big = np.asarray(img.resize((32, 32), Image.BILINEAR), np.float32)
+    ahash = _bits_to_int(small > small.mean())
+    dhash = _bits_to_int(wide[:, 1:] > wide[:, :-1])
+    # low frequencies of DCT, the DC term is excluded by the median
+    dct = (_DCT_32 @ big @ _DCT_32.T)[:8, :8]
+    phash = _bits_to_int(dct > np.median(dct.flatten()[1:]))
+    return dict(ahash=ahash, dhash=dhash, phash=phash)
+
+
+def _compute_hashes_worker(key):
+    """Compute the hashes of an image in a worker process. Errors are
+    returned as None."""
+    try:
+        return key, compute_hashes(key)
+    except Exception:
+        return key, None
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """BK-tree for searching hashes within a Hamming distance.
+
+    Each node is [hash, items, {distance: child}].
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            dist = hamming(value, node[0])
+            if dist == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(dist)
+            if child is None:
+                node[2][dist] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """Get all the items within the radius."""
+        results = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            dist = hamming(value, node[0])
+            if dist <= radius:
+                results.extend(node[1])
+            # triangle inequality: only children in [d - r, d + r] can match
+            for child_dist, child in node[2].items():
+                if dist - radius <= child_dist <= dist + radius:
+                    nodes.append(child)
+        return results
+
+
+def find_groups(hashes, radius):
+    """Group images whose hash distance is within the radius.
+
+    Args:
+        hashes (dict): {key: 64-bit int}.
+        radius (int): Max Hamming distance of near-duplicates.
+
+    Returns:
+        list[list[str]]: Groups with at least two images. Keys in a group
+            keep the input order.
+    """
+    tree = BKTree()
+    for key, value in hashes.items():
+        tree.add(value, key)
+
+    # union-find over the search results
+    parents = {key: key for key in hashes}
+
+    def find(key):
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    for key, value in hashes.items():
+        for other in tree.search(value, radius):
+            root_a, root_b = find(key), find(other)
+            if root_a != root_b:
+                parents[root_b] = root_a
+
+    groups = {}
+    for key in hashes:
+        groups.setdefault(find(key), []).append(key)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def get_hashes(keys, num_workers=None, progress=None, cancel_event=None):
+    """Get hashes of images, from the directory index if possible.
+
+    Args:
+        keys (list[str]): Image keys.
+        num_workers (int): Number of processes. Default: None (CPU count).
+        progress (func): Called with (number of finished, total).
+            Default: None.
+        cancel_event (threading.Event): Stop when it is set. Default: None.
+
+    Returns:
+        dict: {key: {hash type: 64-bit int}}. Broken images are skipped.
+    """
+    results = {}
+    stats = {}
+    missing = []
+    for key in keys:
+        folder, name = split_folder(key)
+        try:
+            stats[key] = get_stat(key)
+        except (OSError, KeyError):
+            continue
+        hashes = get_dir_index(folder).get(name, 'hash', stats[key])
+        if hashes is None:
+            missing.append(key)
+        else:
+            results[key] = hashes
+    if progress is not None:
+        progress(len(results), len(keys))
+
+    if missing:
+        num_done = 0
+        with new_process_pool(num_workers) as executor:
+            futures = [
+                executor.submit(_compute_hashes_worker, key) for key in missing
+            ]
+            for future in as_completed(futures):
+                if cancel_event is not None and cancel_event.is_set():
+                    for f in futures:
+                        f.cancel()
+                    break
+                key, hashes = future.result()
+                if hashes is not None:
+                    results[key] = hashes
+                    folder, name = split_folder(key)
+                    get_dir_index(folder).set(name, 'hash', hashes, stats[key])
+                num_done += 1
+                if progress is not None and (num_done % 32 == 0
+                                             or num_done == len(missing)):
+                    progress(len(results), len(keys))
+        save_dir_indexes()
+    return results
+
+
+class DuplicateFinder(QtCore.QObject):
+    """Find duplicate groups in the background.
+
+    Signals:
+        progress (int, int): Number of hashed images and the total.
+        found (list): Duplicate groups.
+    """
+    progress = QtCore.pyqtSignal(int, int)
+    found = QtCore.pyqtSignal(list)
+
+    def __init__(self, parent=None):
+        super(DuplicateFinder, self).__init__(parent)
+        self.cancel_event = None
+
+    def start(self, keys, hash_type='phash', radius=4):
+        self.cancel()
+        self.cancel_event = threading.Event()
+        threading.Thread(
+            target=self.run,
+            args=(list(keys), hash_type, radius, self.cancel_event),
+            daemon=True).start()
+
+    def cancel(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def run(self, keys, hash_type, radius, cancel_event):
+        hashes = get_hashes(
+            keys,
+            progress=lambda done, total: self.progress.emit(done, total),
+            cancel_event=cancel_event)
+        if cancel_event.is_set():
+            return
+        # keep the order of the image list
+        hashes = {key: hashes[key][hash_type] for key in keys if key in hashes}
+        self.found.emit(find_groups(hashes, radius))
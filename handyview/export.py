@@ -0,0 +1,107 @@
+"""
+Export the same crop (region of interest) from all the images in all the
+image lists, e.g., for the zoomed-in patches in paper figures.
+"""
+import os
+import threading
+from archive import split_key
+from concurrent.futures import as_completed
+from decoders import load_image
+from PIL import Image
+from PyQt5 import QtCore
+from utils import new_process_pool
+
+
+def crop_image(key, box, scale, save_path):
+    """Crop a region, upscale it with nearest neighbour and save it."""
+    # only the region is decoded when the format allows
+    region = load_image(key, box=box)
+    if scale != 1:
+        region = region.resize((region.width * scale, region.height * scale),
+                               Image.NEAREST)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    region.save(save_path)
+
+
+def _crop_worker(key, box, scale, save_path):
+    """Export a crop in a worker process. Errors are returned as str."""
+    try:
+        crop_image(key, box, scale, save_path)
+    except Exception as error:
+        return f'{key}: {error}'
+    return None
+
+
+def sanitize_member(member):
+    """Make an archive member name a safe relative path, the same way as
+    zipfile.extract, i.e., drop the drive, the root and the '.' and '..'
+    components, so that it never escapes the save folder."""
+    member = os.path.splitdrive(member.replace('\\', '/'))[1]
+    parts = [part for part in member.split('/') if part not in ('', '.', '..')]
+    return os.path.join(*parts)
+
+
+def get_crop_jobs(img_lists, save_folder):
+    """Get (key, save path) for all the images in all the image lists.
+
+    Crops of each image list are saved in a sub-folder named by the index
+    and the root folder (or archive) of the list. The paths relative to the
+    root are kept, so that images with the same name in different
+    sub-folders (e.g., in recursive mode) do not overwrite each other.
+    """
+    jobs = []
+    for list_idx, img_list in enumerate(img_lists):
+        if not img_list:
+            continue
+        archive_path, _ = split_key(img_list[0])
+        if archive_path is not None:
+            folder = archive_path
+            rel_paths = [
+                sanitize_member(split_key(key)[1]) for key in img_list
+            ]
+        else:
+            folder = os.path.commonpath(
+                [os.path.dirname(key) for key in img_list]) or '.'
+            rel_paths = [os.path.relpath(key, folder) for key in img_list]
+        folder_name = os.path.splitext(
+            os.path.basename(os.path.abspath(folder)))[0]
+        sub_folder = os.path.join(save_folder, f'{list_idx}_{folder_name}')
+        for key, rel_path in zip(img_list, rel_paths):
+            save_path = os.path.join(sub_folder, rel_path)
+            jobs.append((key, f'{os.path.splitext(save_path)[0]}.png'))
+    return jobs
+
+
+class CropExporter(QtCore.QObject):
+    """Export crops on a process pool in the background.
+
+    Signals:
+        progress (int, int): Number of finished crops and the total.
+        finished (list): Error messages.
+    """
+    progress = QtCore.pyqtSignal(int, int)
+    finished = QtCore.pyqtSignal(list)
+
+    def __init__(self, parent=None, num_workers=None):
+        super(CropExporter, self).__init__(parent)
+        self.num_workers = num_workers
+
+    def start(self, img_lists, box, scale, save_folder):
+        jobs = get_crop_jobs(img_lists, save_folder)
+        threading.Thread(
+            target=self.run, args=(jobs, box, scale), daemon=True).start()
+
+    def run(self, jobs, box, scale):
+        errors = []
+        with new_process_pool(self.num_workers) as executor:
+            futures = [
+                executor.submit(_crop_worker, key, box, scale, save_path)
+                for key, save_path in jobs
+            ]
+            for num_done, future in enumerate(as_completed(futures), 1):
+                error = future.result()
+                if error is not None:
+                    errors.append(error)
+                if num_done % 16 == 0 or num_done == len(jobs):
+                    self.progress.emit(num_done, len(jobs))
+        self.finished.emit(errors)
@@ -0,0 +1,132 @@
+"""
+Include/exclude filter engine.
+
+A filter term can be:
+    - a key word, e.g., 'x4'. Match base names containing it.
+    - a glob, e.g., '*_x4*'. Match base names with fnmatch.
+    - a regex with the 're:' prefix, e.g., 're:^\\d{4}$'. Search base names.
+    - a metadata predicate, e.g., 'width>=1024' or 'mode==RGB'.
+
+All the name terms are compiled into one regex, so that each base name is
+matched only once.
+"""
+import fnmatch
+import os
+import re
+from metadata import check_predicates, parse_predicate
+
+
+def compile_name_terms(terms):
+    """Compile name terms (key words, globs and regexes) into one regex.
+
+    Returns:
+        re.Pattern | None: None if there is no name term.
+    """
+    patterns = []
+    for term in terms:
+        if term.startswith('re:'):
+            pattern = term[3:]
+            # raise re.error for a wrong regex
+            re.compile(pattern)
+        elif any(c in term for c in '*?['):
+            # fnmatch.translate only anchors the end, since the names are
+            # searched
+            pattern = '^' + fnmatch.translate(term)
+        else:
+            pattern = re.escape(term)
+        patterns.append(f'(?:{pattern})')
+    if not patterns:
+        return None
+    return re.compile('|'.join(patterns))
+
+
+class ImageFilter:
+    """Compiled include/exclude filter.
+
+    Images are kept if they match any include name term and all the include
+    predicates, and do not match any exclude name term or exclude predicate.
+
+    Args:
+        include_terms (list[str]): Include terms. Default: None.
+        exclude_terms (list[str]): Exclude terms. Default: None.
+    """
+
+    def __init__(self, include_terms=None, exclude_terms=None):
+        self.include_terms = list(include_terms or [])
+        self.exclude_terms = list(exclude_terms or [])
+
+        include_names, self.include_predicates = self._split(
+            self.include_terms)
+        exclude_names, self.exclude_predicates = self._split(
+            self.exclude_terms)
+        self.include_pattern = compile_name_terms(include_names)
+        self.exclude_pattern = compile_name_terms(exclude_names)
+
+    @staticmethod
+    def _split(terms):
+        """Split terms into name terms and metadata predicates."""
+        names, predicates = [], []
+        for term in terms:
+            predicate = parse_predicate(term)
+            if predicate is None:
+                names.append(term)
+            else:
+                predicates.append(predicate)
+        return names, predicates
+
+    @property
+    def is_empty(self):
+        return not (self.include_terms or self.exclude_terms)
+
+    @property
+    def has_predicates(self):
+        return bool(self.include_predicates or self.exclude_predicates)
+
+    def match_name(self, path):
+        """Whether the base name of a path passes the name terms."""
+        base = os.path.splitext(os.path.basename(path))[0]
+        if (self.include_pattern is not None
+                and self.include_pattern.search(base) is None):
+            return False
+        if (self.exclude_pattern is not None
+                and self.exclude_pattern.search(base) is not None):
+            return False
+        return True
+
+    def match_meta(self, meta):
+        """Whether the metadata passes the predicates.
+
+        Images whose metadata is not probed yet (meta is None) are kept.
+        """
+        if meta is None:
+            return True
+        if not check_predicates(meta, self.include_predicates):
+            return False
+        return not any(
+            op(meta[field], value)
+            for field, op, value in self.exclude_predicates)
+
+    def __call__(self, path, meta=None):
+        return self.match_name(path) and self.match_meta(meta)
+
+    def filter(self, img_list, metas=None):
+        """Filter an image list.
+
+        Args:
+            img_list (list[str]): Image list.
+            metas (dict): Metadata of images, indexed by path. Default: None.
+
+        Returns:
+            list[int]: Indices of the kept images.
+        """
+        if self.is_empty:
+            return list(range(len(img_list)))
+        metas = metas or {}
+        match_name = self.match_name
+        if not self.has_predicates:
+            return [i for i, path in enumerate(img_list) if match_name(path)]
+        match_meta = self.match_meta
+        return [
+            i for i, path in enumerate(img_list)
+            if match_name(path) and match_meta(metas.get(path))
+        ]
@@ -1,20 +1,35 @@
 import actions as actions
-import glob
+import bisect
+import functools
 import os
 import re
 import sys
-from PIL import Image
+from animation import AnimationPlayer
+from archive import (get_cached_bytes, get_reader, get_size, is_archive,
+                     is_archive_key, split_key)
+from decoders import get_qimage_mode, load_qimage, probe
+from dedup import HASH_TYPES, DuplicateFinder
+from export import CropExporter
+from filters import ImageFilter
+from heatmap import HeatmapItem
+from image_cache import ImageCache, count_unique_bytes
+from metadata import META_FIELDS, MetaProber
+from mosaic import MosaicWidget
+from playback import FramePlayer
+from process_decoder import ProcessDecoder
 from PyQt5 import QtCore
-from PyQt5.QtGui import QIcon, QImage, QPixmap
+from PyQt5.QtGui import QColor, QIcon, QPixmap
 from PyQt5.QtWidgets import (QApplication, QDockWidget, QFileDialog,
                              QGridLayout, QInputDialog, QLabel, QLineEdit,
-                             QMainWindow, QPushButton, QToolBar, QWidget)
+                             QMainWindow, QProgressBar, QPushButton, QToolBar,
+                             QWidget)
+from scanner import DirScanner, find_first_image, list_dir, scan_tree
+from tasks import TaskRunner
+from tiles import TiledImageItem, get_pixmap_bytes
+from utils import is_image_file, natural_sort_key, sizeof_fmt
 from view_scene import HVScene, HVView
 from widgets import ColorLabel, HLine, HVLable, MessageDialog, show_msg
 
-FORMATS = ('.jpg', '.JPG', '.jpeg', '.JPEG', '.png', '.PNG', '.ppm', '.PPM',
-           '.bmp', '.BMP', '.gif', '.GIF', '.tiff')
-
 if getattr(sys, 'frozen', False):
     # If the application is run as a bundle, the PyInstaller bootloader
     # extends the sys module by a flag frozen=True and sets the app
@@ -24,37 +39,121 @@ else:
     CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
 
 
-def get_img_list(path, include_names=None, exclude_names=None):
-    img_list = []
+def get_img_list(path, img_filter=None, recursive=False):
+    """Get the image list of a folder (or an archive) with natural sort.
+
+    Args:
+        path (str): Folder or archive path.
+        img_filter (ImageFilter): Filter by names. Canvas caches the listing
+            without filter, and filters it later. Default: None.
+        recursive (bool): Whether to list the sub-folders. Default: False.
+    """
     if path == '':
         path = './'
-    # deal with include and exclude names
-    for img_path in sorted(glob.glob(os.path.join(path, '*'))):
-        img_path = img_path.replace('\\', '/')
-        img_name = os.path.split(img_path)[-1]
-        base, ext = os.path.splitext(img_name)
-        if ext in FORMATS:
-            if include_names is not None:
-                flag_add = False
-                for include_name in include_names:
-                    if include_name in base:
-                        flag_add = True
-            elif exclude_names is not None:
-                flag_add = True
-                for exclude_name in exclude_names:
-                    if exclude_name in base:
-                        flag_add = False
-            else:
-                flag_add = True
-            if flag_add:
-                img_list.append(img_path)
-    # natural sort for numbers in name
-    img_list.sort(
-        key=lambda s:
-        [int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', s)])
+    # images inside an archive, path is either the archive or a member folder
+    archive_path, _ = split_key(path)
+    if archive_path is not None or is_archive(path):
+        return get_reader(archive_path or path).get_img_list(img_filter)
+
+    if recursive:
+        return scan_tree(path, img_filter)
+
+    # natural sort for numbers in name, cached in the directory index
+    files, _ = list_dir(path)
+    img_list = [os.path.join(path, name).replace('\\', '/') for name in files]
+    if img_filter is not None:
+        img_list = [p for p in img_list if img_filter.match_name(p)]
     return img_list
 
 
+def open_main_key(key,
+                  img_filter=None,
+                  recursive=False,
+                  scan_root=None,
+                  cancel_event=None,
+                  report=None):
+    """Find the image to show for a key, list its folder and decode it.
+
+    It does not touch the canvas, so that it can run in a background task.
+
+    Args:
+        key (str): Image path, folder, archive or archive key.
+        img_filter (ImageFilter): Filter used to find the first image of a
+            folder. Default: None.
+        recursive (bool): Recursive folder mode, where the folder tree is
+            walked later by the scanner. Default: False.
+        scan_root (str): Root folder of the current recursive scanning,
+            which is kept when refreshing. Default: None.
+        cancel_event (threading.Event): Unused, see TaskRunner.
+        report (func): Called with progress messages. Default: None.
+
+    Returns:
+        dict: 'key' of the image, its folder listing 'img_list' (None in
+            recursive mode), the 'root' folder of recursive mode and the
+            decoded 'qimg'.
+    """
+    if report is None:
+        report = lambda message: None  # noqa: E731
+    # fix the key pattern passed from windows system when double click
+    key = key.replace('\\', '/')
+    root, img_list = None, None
+    if recursive and not (is_archive_key(key) or is_archive(key)):
+        if os.path.isdir(key):
+            root = key
+            report(f'Finding the first image in {root} ...')
+            key = find_first_image(root)
+            if key is None:
+                raise ValueError(f'No image in {root}')
+        elif scan_root is not None and key.startswith(scan_root + '/'):
+            # refresh, keep the root folder
+            root = scan_root
+        else:
+            root = os.path.dirname(key)
+    else:
+        # if key is a folder, get the first image path
+        if os.path.isdir(key):
+            report(f'Listing {key} ...')
+            folder_img_list = get_img_list(key, img_filter)
+            if folder_img_list:
+                key = folder_img_list[0]
+        # if key is an archive, get the first image inside it
+        if is_archive(key):
+            archive_img_list = get_img_list(key)
+            if not archive_img_list:
+                raise ValueError(f'No image in {key}')
+            key = archive_img_list[0]
+        if not is_image_file(key):
+            raise ValueError(f'Wrong key! {key}')
+        path, _ = os.path.split(key)
+        report(f'Listing {path} ...')
+        img_list = get_img_list(path)
+    report(f'Decoding {key} ...')
+    qimg = load_qimage(key)
+    return dict(key=key, img_list=img_list, root=root, qimg=qimg)
+
+
+def list_cmp_folder(cmp_path, recursive=False, cancel_event=None, report=None):
+    """List the folder (or archive) of a comparison image.
+
+    Args:
+        cmp_path (str): Image path, archive or archive key.
+        recursive (bool): Whether to list the sub-folders. Default: False.
+        cancel_event (threading.Event): Stop walking the sub-folders when it
+            is set. Default: None.
+        report (func): Unused, see TaskRunner.
+
+    Returns:
+        list[str]: Image list with natural sort.
+    """
+    if is_archive(cmp_path):
+        path = cmp_path
+    else:
+        path, _ = os.path.split(cmp_path)
+    if recursive and not (is_archive(cmp_path) or is_archive_key(cmp_path)):
+        return scan_tree(path, cancel_event=cancel_event)
+    return get_img_list(path)
+
+
 class Canvas(QWidget):
     """The main canvas to show the image, information panel."""
 
@@ -67,26 +166,101 @@ class Canvas(QWidget):
             # show the icon image
             self.key = os.path.join(CURRENT_PATH, 'icon.png')
 
-        try:
-            open(self.key, 'r')
-        except IOError:
+        if not os.path.exists(split_key(self.key)[0] or self.key):
             print(f'There was an error opening {self.key}')
             sys.exit(1)
 
+        # decoded images shared by the view, the mosaic and the heatmap
+        self.image_cache = ImageCache()
+
         # initialize widgets and layout
         self.init_widgets_layout()
 
-        self.include_names = None
-        self.exclude_names = None
+        # compiled include/exclude filter
+        self.img_filter = ImageFilter()
         self.qview_bg_color = 'white'
         # list of image list
         # the first list is the main list, the others are for comparisons
         self.img_list = [[]]
         self.img_list_idx = 0
-
-        if self.key.endswith(FORMATS):
-            self.get_main_img_list()
-            self.show_image(init=True)
+        self.dirpos = 0
+        self.img_name = ''
+        # image lists with natural sort, before sorting and filtering by
+        # metadata
+        self.base_img_list = [[]]
+        # sort and filter by metadata, probed in the background
+        self.sort_by = 'name'
+        self.sort_reverse = False
+        self.img_meta = {}
+        self.meta_prober = MetaProber(self)
+        self.meta_prober.probed.connect(self.add_probed_meta)
+        # reorder at most once in a short period when probes stream in
+        self.meta_timer = QtCore.QTimer(self)
+        self.meta_timer.setSingleShot(True)
+        self.meta_timer.setInterval(300)
+        self.meta_timer.timeout.connect(self.update_img_lists)
+        # decode on a process pool for playback and mosaic, None for the
+        # decoding in threads
+        self.process_decoder = None
+        # frame-sequence playback of the image lists
+        self.player = FramePlayer(self)
+        # show |main - comparison| as a heatmap instead of the image
+        self.diff_mode = False
+        self.diff_amplification = 1
+        self.heatmap_item = None
+        # draw the value inside each pixel at high zoom
+        self.show_pixel_values = True
+        # frames of the shown animated GIF or multi-page TIFF
+        self.animation = AnimationPlayer(self)
+        # recursive folder mode, the main image list is streamed from a
+        # background scanner
+        self.recursive = False
+        self.scanner = DirScanner(self)
+        self.scanner.found.connect(self.add_scanned_images)
+        self.scanner.finished.connect(self.scan_finished)
+        self.scan_id = None
+        self.scan_root = None
+        # sorted (natural sort key, path) of the scanned images, and the
+        # batches waiting to be merged
+        self.scan_first_key = None
+        self.scan_entries = []
+        self.scan_pending = []
+        # merge the scanned batches at most once per interval
+        self.scan_merge_timer = QtCore.QTimer(self)
+        self.scan_merge_timer.setSingleShot(True)
+        self.scan_merge_timer.setInterval(200)
+        self.scan_merge_timer.timeout.connect(self.merge_scanned_images)
+        # duplicate groups, key -> (group index, number of groups)
+        self.dup_finder = DuplicateFinder(self)
+        self.dup_finder.progress.connect(self.show_hash_progress)
+        self.dup_finder.found.connect(self.show_duplicate_groups)
+        self.dup_groups = {}
+        # export crops of the selection rect
+        self.crop_exporter = CropExporter(self)
+        self.crop_exporter.progress.connect(self.show_export_progress)
+        self.crop_exporter.finished.connect(self.export_finished)
+        # synchronized mosaic of all the image lists
+        self.mosaic_mode = False
+        # lean memory mode keeps only the QImage of the shown image
+        self.lean_memory = False
+
+        # listing and loading work of opening folders, in the background.
+        # One runner for each kind of task, so that opening a folder only
+        # aborts the previous opening.
+        self.task_callbacks = {}
+        self.task_messages = {}
+        self.opener = self.new_task_runner()
+        self.cmp_lister = self.new_task_runner()
+
+        if (is_image_file(self.key) or is_archive(self.key)
+                or os.path.isdir(self.key)):
+            # the window is not shown yet, open the first key at once
+            try:
+                result = open_main_key(self.key, self.img_filter)
+            except (OSError, ValueError) as error:
+                print(error)
+                sys.exit(1)
+            self.set_main_img_list(result, init=True)
         else:
             print('Unsupported file format.')
             sys.exit(1)
@@ -95,6 +269,9 @@ class Canvas(QWidget):
         # QGraphicsView - QGraphicsScene - QPixmap
         self.qscene = HVScene(self)
         self.qview = HVView(self.qscene, self)
+        # mosaic panes of all the image lists, shown in place of qview
+        self.mosaic = MosaicWidget(self)
+        self.mosaic.hide()
 
         # name label showing image index and image path
         self.name_label = HVLable('', self, 'green', 'Times', 15)
@@ -108,6 +285,8 @@ class Canvas(QWidget):
         self.info_label = HVLable('', self, 'blue', 'Times', 12)
         # zoom label showing zoom ratio
         self.zoom_label = HVLable('1.00', self, 'green', 'Times', 12)
+        # playback label showing achieved and target FPS
+        self.fps_label = HVLable('Play: stopped', self, 'black', 'Times', 12)
         # mouse position and mouse rgb value
         mouse_pos_text = ('Cursor position:\n (ignore zoom)\n'
                           ' Height(y): 0.0\n Width(x):  0.0')
@@ -128,8 +307,12 @@ class Canvas(QWidget):
         # include and exclude names
         self.include_names_label = HVLable('', self, 'black', 'Times', 12)
         self.exclude_names_label = HVLable('', self, 'black', 'Times', 12)
+        # sort and filter by metadata
+        self.sort_label = HVLable('Sort: name', self, 'black', 'Times', 12)
         # comparison folders
         self.comparison_label = HVLable('', self, 'red', 'Times', 12)
+        # resident bytes of the image buffers
+        self.memory_label = HVLable('Memory:', self, 'black', 'Times', 12)
 
         # ---------
         # layouts
@@ -145,6 +328,7 @@ class Canvas(QWidget):
         main_layout.addLayout(name_grid, 1, 0, 1, 10)
 
         main_layout.addWidget(self.qview, 0, 0, -1, 50)
+        main_layout.addWidget(self.mosaic, 0, 0, -1, 50)
         # blank label for layout
         blank_label = HVLable('', self, 'black', 'Times', 12)
         main_layout.addWidget(blank_label, 61, 0, 1, 1)
@@ -153,7 +337,7 @@ class Canvas(QWidget):
         if event.key() == QtCore.Qt.Key_F9:
             self.toggle_bg_color()
         elif event.key() == QtCore.Qt.Key_R:
-            self.qview.set_zoom(1)
+            self.active_view.set_zoom(1)
         elif event.key() == QtCore.Qt.Key_C:
             self.compare_folders(1)
         elif event.key() == QtCore.Qt.Key_V:
@@ -167,9 +351,49 @@ class Canvas(QWidget):
         elif event.key() == QtCore.Qt.Key_Left:
             self.dir_browse(-1)
         elif event.key() == QtCore.Qt.Key_Up:
-            self.qview.zoom_in()
+            self.active_view.zoom_in()
         elif event.key() == QtCore.Qt.Key_Down:
-            self.qview.zoom_out()
+            self.active_view.zoom_out()
+        elif event.key() == QtCore.Qt.Key_M:
+            self.parent.mosaic_action.trigger()
+        elif event.key() == QtCore.Qt.Key_P:
+            self.player.toggle()
+        elif event.key() == QtCore.Qt.Key_BracketLeft:
+            self.player.set_fps(self.player.fps - 5)
+        elif event.key() == QtCore.Qt.Key_BracketRight:
+            self.player.set_fps(self.player.fps + 5)
+        elif event.key() == QtCore.Qt.Key_Comma:
+            self.animation.step(-1)
+        elif event.key() == QtCore.Qt.Key_Period:
+            self.animation.step(1)
+        elif event.key() == QtCore.Qt.Key_G:
+            self.animation.toggle()
+        elif event.key() == QtCore.Qt.Key_Escape:
+            self.cancel_tasks()
+        elif event.key() == QtCore.Qt.Key_H:
+            self.parent.diff_action.trigger()
+        elif event.key() == QtCore.Qt.Key_Minus:
+            self.set_diff_amplification(self.diff_amplification / 2)
+        elif event.key() == QtCore.Qt.Key_Equal:
+            self.set_diff_amplification(self.diff_amplification * 2)
+
+    @property
+    def active_view(self):
+        """The mosaic in mosaic mode, otherwise the single view."""
+        return self.mosaic if self.mosaic_mode else self.qview
+
+    def set_mosaic_mode(self, mosaic_mode):
+        """Show all the image lists in a synchronized mosaic, or show one
+        image list in the single view."""
+        self.mosaic_mode = mosaic_mode
+        if mosaic_mode:
+            self.mosaic.zoom = self.qview.zoom
+            self.qview.hide()
+            self.mosaic.show()
+        else:
+            self.mosaic.hide()
+            self.qview.show()
+        self.show_image()
 
     def goto_button_clicked(self):
         goto_str = self.goto_edit.text()
@@ -182,34 +406,183 @@ class Canvas(QWidget):
         self.key = self.img_list[self.img_list_idx][self.dirpos]
         self.show_image()
 
-    def get_main_img_list(self):
-        # if key is a folder, get the first image path
-        if os.path.isdir(self.key):
-            self.key = sorted(glob.glob(os.path.join(self.key, '*')))[0]
-
-        # fix the key pattern passed from windows system when double click
-        self.key = self.key.replace('\\', '/')
-
-        if self.key.endswith(FORMATS):
-            # get image list
+    def open_main(self, key, init=True):
+        """Open an image, a folder or an archive in the background.
+
+        The previous opening and the recursive scanning are aborted.
+
+        Args:
+            key (str): Image path, folder, archive or archive key.
+            init (bool): Whether to reset the zoom ratio. Default: True.
+        """
+        self.scanner.cancel()
+        self.scan_id = None
+        self.dup_finder.cancel()
+        callback = functools.partial(self.set_main_img_list, init=init)
+        self.start_task(self.opener, f'Opening {key} ...', callback,
+                        open_main_key, key, self.img_filter, self.recursive,
+                        self.scan_root)
+
+    def set_main_img_list(self, result, init=True):
+        """Set the main image list from the result of open_main_key, and
+        show the opened image."""
+        self.key = result['key']
+        self.dup_groups = {}
+        if result['root'] is not None:
+            self.start_recursive_scan(result['root'])
+        else:
+            self.scan_root = None
             self.path, self.img_name = os.path.split(self.key)
-            self.img_list[self.img_list_idx] = get_img_list(
-                self.path, self.include_names, self.exclude_names)
+            self.set_img_list(self.img_list_idx, result['img_list'])
             # get current position
+            img_list = self.img_list[self.img_list_idx]
             try:
-                self.dirpos = self.img_list[self.img_list_idx].index(self.key)
+                self.dirpos = img_list.index(self.key)
             except ValueError:
-                # self.key may not in self.img_list after refreshing
+                # self.key may not in self.img_list after refreshing or
+                # filtering
                 self.dirpos = 0
+                if img_list:
+                    self.key = img_list[0]
+                    self.path, self.img_name = os.path.split(self.key)
             # save open file history
             self.save_open_history()
+            self.player.invalidate()
+        qimg = result['qimg'] if self.key == result['key'] else None
+        self.show_image(init=init, qimg=qimg)
+
+    def start_recursive_scan(self, root):
+        """Walk the folder tree in the background.
+
+        The first image (self.key) is shown at once, and the others are
+        added to the image list as they are found.
+        """
+        self.scan_root = root.rstrip('/')
+        self.path, self.img_name = os.path.split(self.key)
+        self.scan_first_key = self.key
+        self.scan_entries = [(natural_sort_key(self.key), self.key)]
+        self.scan_pending = []
+        self.scan_list_idx = self.img_list_idx
+        self.set_img_list(self.img_list_idx, [self.key])
+        self.dirpos = 0
+        self.save_open_history()
+        self.scan_id = self.scanner.start(root)
+
+    def new_task_runner(self):
+        runner = TaskRunner(self)
+        runner.progress.connect(
+            functools.partial(self.show_task_progress, runner))
+        runner.finished.connect(functools.partial(self.task_finished, runner))
+        runner.failed.connect(functools.partial(self.task_failed, runner))
+        return runner
+
+    def start_task(self, runner, message, callback, func, *args):
+        """Run listing and loading work in the background, with a busy
+        indicator. The previous task of the runner is aborted.
+
+        Args:
+            runner (TaskRunner): Runner of this kind of task.
+            message (str): Message shown while running.
+            callback (func): Called with the result in the main thread.
+            func (func): Task function, see TaskRunner.
+        """
+        self.task_callbacks[runner] = callback
+        runner.start(func, *args)
+        self.set_task_message(runner, message)
+
+    def set_task_message(self, runner, message):
+        """Show the message of the latest running task, or hide the busy
+        indicator if no task is running."""
+        if message is None:
+            self.task_messages.pop(runner, None)
         else:
-            show_msg('Critical', 'Critical', f'Wrong key! {self.key}')
+            self.task_messages[runner] = message
+        messages = list(self.task_messages.values())
+        self.parent.set_busy(messages[-1] if messages else None)
+
+    def show_task_progress(self, runner, task_id, message):
+        if task_id == runner.task_id:
+            self.set_task_message(runner, message)
+
+    def task_finished(self, runner, task_id, result):
+        if task_id != runner.task_id:
+            return
+        self.set_task_message(runner, None)
+        self.task_callbacks.pop(runner)(result)
+
+    def task_failed(self, runner, task_id, message):
+        if task_id != runner.task_id:
+            return
+        self.set_task_message(runner, None)
+        show_msg('Critical', 'Critical', message)
+
+    def cancel_tasks(self):
+        """Abort all the running listing and loading work."""
+        running = [
+            runner for runner in (self.opener, self.cmp_lister)
+            if runner.running
+        ]
+        for runner in running:
+            runner.cancel()
+            self.set_task_message(runner, None)
+        if running:
+            self.parent.set_statusbar('Opening cancelled.')
+
+    def add_scanned_images(self, scan_id, entries):
+        """Queue a sorted batch of scanned images, which is merged into the
+        image list later by merge_scanned_images."""
+        if scan_id != self.scan_id:
+            return
+        # the first image is already in the list
+        self.scan_pending.extend(entry for entry in entries
+                                 if entry[1] != self.scan_first_key)
+        if self.view_enabled and self.need_meta and self.scan_list_idx == 0:
+            self.meta_prober.probe([path for _, path in entries])
+        if not self.scan_merge_timer.isActive():
+            self.scan_merge_timer.start()
+
+    def merge_scanned_images(self):
+        """Merge the queued batches into the image list, keeping the natural
+        sort.
+
+        The batches are sorted runs, so sorting the concatenation merges
+        them in linear time.
+        """
+        if self.scan_id is None or not self.scan_pending:
+            return
+        self.scan_entries.extend(self.scan_pending)
+        self.scan_pending = []
+        self.scan_entries.sort()
+        # update in place, the list may also be the shown list
+        img_list = self.base_img_list[self.scan_list_idx]
+        img_list[:] = [path for _, path in self.scan_entries]
+        if self.view_enabled:
+            self.meta_timer.start()
+        elif self.scan_list_idx == self.img_list_idx:
+            # keep the shown image
+            self.dirpos = bisect.bisect_left(
+                self.scan_entries, (natural_sort_key(self.key), self.key))
+        self.update_name_label()
+
+    def scan_finished(self, scan_id):
+        if scan_id != self.scan_id:
+            return
+        self.scan_merge_timer.stop()
+        self.merge_scanned_images()
+        self.scan_id = None
+        self.scan_entries = []
+        self.update_name_label()
+        self.player.invalidate()
 
     def update_cmp_img_list(self, cmp_path):
-        path, _ = os.path.split(cmp_path)
-        self.img_list.append(
-            get_img_list(path, self.include_names, self.exclude_names))
+        """Add the folder (or archive) of cmp_path as a comparison image
+        list. It is listed in the background."""
+        self.start_task(self.cmp_lister, f'Listing {cmp_path} ...',
+                        self.add_cmp_img_list, list_cmp_folder, cmp_path,
+                        self.recursive)
+
+    def add_cmp_img_list(self, img_list):
+        self.set_img_list(len(self.img_list), img_list)
         # all the image list should have the same length
         all_same_len = True
         lens_img_list = [len(self.img_list[0])]
@@ -221,11 +594,180 @@ class Canvas(QWidget):
         show_str = 'Number for each folder:\n\t' + '\n\t'.join(
             map(str, lens_img_list))
         self.comparison_label.setText(show_str)
+        self.player.invalidate()
         if all_same_len is False:
             msg = ('Comparison folders have differnet number of images.\n'
                    f'{show_str}')
             show_msg('Warning', 'Warning!', msg)
 
+    def set_img_list(self, idx, img_list):
+        """Set an image listing (with natural sort and without filter), and
+        then filter and sort it.
+
+        Args:
+            idx (int): Index of the image list. Append a new one if it equals
+                to the number of image lists.
+            img_list (list[str]): Image list with natural sort.
+        """
+        if idx == len(self.img_list):
+            self.img_list.append(img_list)
+            self.base_img_list.append(img_list)
+        else:
+            self.img_list[idx] = img_list
+            self.base_img_list[idx] = img_list
+        if idx == 0:
+            # probe again, the cache in the directory index is still valid
+            # for unchanged files
+            self.meta_prober.cancel()
+            self.img_meta = {}
+            self.probe_meta()
+        self.update_img_lists()
+
+    @property
+    def need_meta(self):
+        return self.sort_by != 'name' or self.img_filter.has_predicates
+
+    @property
+    def view_enabled(self):
+        """Whether the shown lists differ from the cached listings."""
+        return (self.sort_by != 'name' or self.sort_reverse
+                or not self.img_filter.is_empty)
+
+    def probe_meta(self):
+        """Probe metadata of the main image list in the background."""
+        if self.need_meta:
+            keys = [
+                key for key in self.base_img_list[0]
+                if key not in self.img_meta
+            ]
+            self.meta_prober.probe(keys)
+
+    def add_probed_meta(self, job_id, metas):
+        if job_id != self.meta_prober.job_id:
+            return
+        self.img_meta.update(metas)
+        if not self.meta_timer.isActive():
+            self.meta_timer.start()
+
+    def set_img_filter(self, img_filter):
+        """Set the include/exclude filter.
+
+        It is applied to the cached listings without touching the filesystem.
+        """
+        self.img_filter = img_filter
+        self.probe_meta()
+        self.update_img_lists()
+        self.player.invalidate()
+
+    def set_sort(self, sort_by='name', reverse=False):
+        """Set how to sort the image lists.
+
+        Args:
+            sort_by (str): 'name' or one of META_FIELDS. Default: 'name'.
+            reverse (bool): Descending order. Default: False.
+        """
+        self.sort_by = sort_by
+        self.sort_reverse = reverse
+        self.probe_meta()
+        self.update_img_lists()
+        self.player.invalidate()
+
+    def update_img_lists(self):
+        """Filter and sort the cached listings to get the shown image lists.
+
+        The order is decided by the main image list, and applied to the
+        comparison lists with the same length, so that they stay aligned.
+        Images whose metadata is not probed yet are kept and put at the end.
+        """
+        base = self.base_img_list[0]
+        if not self.view_enabled:
+            self.img_list = list(self.base_img_list)
+        else:
+            indices = self.img_filter.filter(base, self.img_meta)
+            if self.sort_by != 'name':
+                metas = self.img_meta
+                known = [i for i in indices if metas.get(base[i])]
+                unknown = [i for i in indices if not metas.get(base[i])]
+                # stable sort, so that ties keep the natural sort
+                known.sort(
+                    key=lambda i: metas[base[i]][self.sort_by],
+                    reverse=self.sort_reverse)
+                indices = known + unknown
+            elif self.sort_reverse:
+                indices.reverse()
+            self.img_list = [[base[i] for i in indices]]
+            for img_list in self.base_img_list[1:]:
+                if len(img_list) == len(base):
+                    self.img_list.append([img_list[i] for i in indices])
+                else:
+                    # not aligned with the main list, only filter by names
+                    self.img_list.append(
+                        [p for p in img_list if self.img_filter.match_name(p)])
+
+        # keep showing the current image
+        img_list = self.img_list[self.img_list_idx]
+        try:
+            self.dirpos = img_list.index(self.key)
+        except ValueError:
+            # the current image is filtered out
+            self.dirpos = max(0, min(self.dirpos, len(img_list) - 1))
+        self.update_name_label()
+
+    def find_duplicates(self, hash_type='phash', radius=4):
+        """Find duplicate groups in the main image list in the background."""
+        self.dup_finder.start(self.img_list[0], hash_type, radius)
+
+    def show_hash_progress(self, num_done, num_total):
+        self.parent.set_statusbar(
+            f'Hashing images for duplicates: {num_done} / {num_total}')
+
+    def show_duplicate_groups(self, groups):
+        """Show duplicate groups one after another as the main image list.
+
+        The comparison lists are removed, and refresh (F5) goes back to the
+        folder.
+        """
+        if self.dup_finder.cancel_event.is_set():
+            # a folder is opened after finding
+            return
+        if not groups:
+            self.parent.set_statusbar('No duplicate found.')
+            return
+        self.parent.set_statusbar(f'Found {len(groups)} duplicate groups.')
+        # the scanned images would be inserted into the duplicate list
+        self.scanner.cancel()
+        self.scan_id = None
+        img_list = [key for group in groups for key in group]
+        self.dup_groups = {
+            key: (group_idx, len(groups))
+            for group_idx, group in enumerate(groups) for key in group
+        }
+        self.img_list = [[]]
+        self.base_img_list = [[]]
+        self.img_list_idx = 0
+        self.comparison_label.setText('')
+        self.set_img_list(0, img_list)
+        self.dirpos = 0
+        self.key = self.img_list[0][0]
+        self.player.invalidate()
+        self.show_image()
+
+    def export_crops(self, save_folder, scale=1):
+        """Export the crop of the selection rect for all the images in all
+        the image lists."""
+        self.crop_exporter.start(self.img_list, self.qview.selection_rect,
+                                 scale, save_folder)
+
+    def show_export_progress(self, num_done, num_total):
+        self.parent.set_statusbar(f'Exporting crops: {num_done} / {num_total}')
+
+    def export_finished(self, errors):
+        if errors:
+            show_msg('Warning', 'Warning!',
+                     f'{len(errors)} crops failed:\n' + '\n'.join(errors[:10]))
+        else:
+            self.parent.set_statusbar('Exporting crops finished.')
+
     def compare_folders(self, direction):
         if len(self.img_list) > 1:
             self.img_list_idx += direction
@@ -262,33 +804,91 @@ class Canvas(QWidget):
             for line in lines:
                 f.write(f'{line}\n')
 
-    def show_image(self, init=False):
+    def show_image(self, init=False, qimg=None):
+        """Show the image of self.key.
+
+        In mosaic mode, the images at the same position of all the image
+        lists are shown instead.
+
+        Args:
+            init (bool): Whether to reset the zoom ratio. Default: False.
+            qimg (QImage): Decoded image of self.key, e.g., from the playback
+                buffer. If None, decode it here. Default: None.
+        """
+        if self.mosaic_mode:
+            self.mosaic.show_position(self.img_list, self.dirpos)
+            self.path, self.img_name = os.path.split(self.key)
+            self.update_name_label()
+            self.parent.set_statusbar(f'{self.key}')
+            self.update_memory_label()
+            return
         self.qscene.clear()
-        self.qimg = QImage(self.key)
-        self.qpixmap = QPixmap.fromImage(self.qimg)
-        self.qscene.addPixmap(self.qpixmap)
-        self.imgw, self.imgh = self.qpixmap.width(), self.qpixmap.height()
+        self.heatmap_item = None
+        # the frames are not opened during the playback of the image list
+        self.animation.open(None if self.player.playing else self.key)
+        if qimg is None:
+            qimg = self.animation.current_frame()
+        if qimg is None:
+            qimg = (
+                self.get_decoded(self.key)
+                if self.diff_mode else load_qimage(self.key))
+        self.qimg = qimg
+        diff_keys = self.get_diff_keys() if self.diff_mode else None
+        if diff_keys is not None:
+            if self.animation.reader is None:
+                # flipping between the pair does not decode it again
+                self.image_cache.put(self.key, qimg)
+            # pairs in view only, the decoded images come from the cache
+            main_qimg, cmp_qimg = [
+                qimg if key == self.key else self.get_decoded(key)
+                for key in diff_keys
+            ]
+            self.qpixmap = None
+            self.heatmap_item = HeatmapItem(main_qimg, cmp_qimg,
+                                            self.diff_amplification)
+            self.qscene.addItem(self.heatmap_item)
+        elif self.lean_memory:
+            # draw the QImage directly, without a QPixmap copy
+            self.qpixmap = None
+            self.qscene.addItem(TiledImageItem(self.qimg, cache_tiles=False))
+        else:
+            self.qpixmap = QPixmap.fromImage(self.qimg)
+            self.qscene.addPixmap(self.qpixmap)
+        self.imgw, self.imgh = self.qimg.width(), self.qimg.height()
         # put image always in the center of a QGraphicsView
         self.qscene.setSceneRect(0, 0, self.imgw, self.imgh)
         # show image path in the statusbar
-        self.parent.set_statusbar(f'{self.key}')
+        if diff_keys is not None:
+            self.parent.set_statusbar(f'|{diff_keys[0]} - {diff_keys[1]}| '
+                                      f'x{self.diff_amplification:g}')
+        elif self.diff_mode:
+            self.parent.set_statusbar(
+                f'{self.key} (no comparison image for the heatmap)')
+        else:
+            self.parent.set_statusbar(f'{self.key}')
 
         try:
-            with Image.open(self.key) as lazy_img:
-                self.color_type = lazy_img.mode
+            self.color_type = probe(self.key)['mode']
         except FileNotFoundError:
             show_msg('Critical', 'Critical', f'Cannot open {self.key}')
+        except Exception:
+            # no header probe for this format, use the decoded image
+            self.color_type = get_qimage_mode(self.qimg)
 
         # update information panel
         self.path, self.img_name = os.path.split(self.key)
-        self.file_size = sizeof_fmt(os.path.getsize(self.key))
-        self.name_label.setText(f'[{self.dirpos + 1:d} / '
-                                f'{len(self.img_list[self.img_list_idx]):d}] '
-                                f'{self.img_name}')
-        self.info_label.setText(
-            'Info: \n'
-            f' Height: {self.imgh:d}\n Width:  {self.imgw:d}\n'
-            f' Size: {self.file_size}\n Type: {self.color_type}')
+        if is_archive_key(self.key):
+            self.file_size = sizeof_fmt(get_size(self.key))
+        else:
+            self.file_size = sizeof_fmt(os.path.getsize(self.key))
+        self.update_name_label()
+        info_text = ('Info: \n'
+                     f' Height: {self.imgh:d}\n Width:  {self.imgw:d}\n'
+                     f' Size: {self.file_size}\n Type: {self.color_type}')
+        if self.animation.num_frames > 1:
+            info_text += (f'\n Frame: {self.animation.frame_idx + 1:d} / '
+                          f'{self.animation.num_frames:d}')
+        self.info_label.setText(info_text)
 
         if init:
             if self.imgw < 500:
@@ -296,8 +896,153 @@ class Canvas(QWidget):
             else:
                 self.qview.set_zoom(1)
         self.qview.set_transform()
+        self.update_memory_label()
+
+    def get_decoded(self, key):
+        """Get a decoded image, from the image cache if possible."""
+        qimg = self.image_cache.get(key)
+        if qimg is None:
+            qimg = load_qimage(key)
+            if not qimg.isNull():
+                self.image_cache.put(key, qimg)
+        return qimg
+
+    def get_diff_keys(self):
+        """Get the (main, comparison) keys of the heatmap at dirpos.
+
+        The comparison is the shown image, or the first comparison folder
+        when the main folder is shown.
+
+        Returns:
+            tuple[str] | None: None if there is no comparison image.
+        """
+        if len(self.img_list) < 2:
+            return None
+        cmp_idx = self.img_list_idx or 1
+        if (self.dirpos >= len(self.img_list[0])
+                or self.dirpos >= len(self.img_list[cmp_idx])):
+            return None
+        return self.img_list[0][self.dirpos], self.img_list[cmp_idx][
+            self.dirpos]
+
+    def set_diff_mode(self, diff_mode):
+        """Show |main - comparison| as a heatmap instead of the image."""
+        self.diff_mode = diff_mode
+        # the shown image is not decoded again
+        self.show_image(qimg=self.qimg)
+
+    def show_heatmap_pixel(self, x_pos, y_pos):
+        """Show the heatmap color and the absolute RGB differences under the
+        mouse in difference mode.
+
+        Returns:
+            bool: Whether the heatmap pixel is shown.
+        """
+        if self.heatmap_item is None:
+            return False
+        diff_pixel = self.heatmap_item.get_pixel(x_pos, y_pos)
+        if diff_pixel is None:
+            return False
+        diff, color = diff_pixel
+        self.mouse_color_label.fill(QColor(*color))
+        self.mouse_rgb_label.setText(
+            f' |diff| ({diff[0]:3d}, {diff[1]:3d}, {diff[2]:3d})')
+        return True
+
+    def set_diff_amplification(self, amplification):
+        self.diff_amplification = min(max(amplification, 0.125), 1024)
+        if self.heatmap_item is not None:
+            self.heatmap_item.set_amplification(self.diff_amplification)
+            diff_keys = self.get_diff_keys()
+            self.parent.set_statusbar(f'|{diff_keys[0]} - {diff_keys[1]}| '
+                                      f'x{self.diff_amplification:g}')
+            self.update_memory_label()
+
+    def set_lean_memory(self, lean_memory):
+        """Keep only one pixel buffer for each shown image.
+
+        The shown image is drawn from its QImage without a QPixmap copy, and
+        the mosaic does not cache tile pixmaps.
+        """
+        self.lean_memory = lean_memory
+        self.mosaic.set_lean_memory(lean_memory)
+        self.show_image()
+
+    def set_show_pixel_values(self, show_pixel_values):
+        """Draw the value inside each visible pixel at high zoom."""
+        self.show_pixel_values = show_pixel_values
+        self.qview.viewport().update()
+        for view in self.mosaic.views:
+            view.viewport().update()
+
+    def set_process_decoding(self, enabled):
+        """Decode images for playback and mosaic on a process pool, or in
+        threads."""
+        if enabled and self.process_decoder is None:
+            self.process_decoder = ProcessDecoder()
+        elif not enabled and self.process_decoder is not None:
+            self.process_decoder.shutdown()
+            self.process_decoder = None
+        self.player.invalidate()
+
+    def update_memory_label(self):
+        """Show resident bytes of the shown image and the image caches.
+
+        A pixel buffer held in several places (e.g., the shown image is also
+        in the image cache) is counted only in the first line.
+        """
+        counted = set()
+        if self.mosaic_mode:
+            image_bytes = 0
+        else:
+            image_bytes = count_unique_bytes([self.qimg], counted)
+            if self.qpixmap is not None:
+                image_bytes += get_pixmap_bytes(self.qpixmap)
+            if self.heatmap_item is not None:
+                image_bytes += self.heatmap_item.tile_bytes
+        decoded_bytes = count_unique_bytes(self.image_cache.cached_images,
+                                           counted)
+        mosaic_bytes = self.mosaic.resident_bytes
+        playback_bytes = count_unique_bytes(self.player.resident_images,
+                                            counted)
+        frames_bytes = count_unique_bytes(self.animation.resident_images,
+                                          counted)
+        archive_bytes = get_cached_bytes()
+        total_bytes = (
+            image_bytes + decoded_bytes + mosaic_bytes + playback_bytes +
+            frames_bytes + archive_bytes)
+        mode = ' (lean)' if self.lean_memory else ''
+        self.memory_label.setText(
+            f'Memory{mode}:\n Image: {sizeof_fmt(image_bytes)}\n'
+            f' Decoded: {sizeof_fmt(decoded_bytes)}\n'
+            f' Mosaic: {sizeof_fmt(mosaic_bytes)}\n'
+            f' Playback: {sizeof_fmt(playback_bytes)}\n'
+            f' Frames: {sizeof_fmt(frames_bytes)}\n'
+            f' Archive: {sizeof_fmt(archive_bytes)}\n'
+            f' Total: {sizeof_fmt(total_bytes)}')
+
+    def update_name_label(self):
+        """Show image index and name. The total number is followed by a '+'
+        when the recursive scanning is not finished."""
+        num_imgs = f'{len(self.img_list[self.img_list_idx]):d}'
+        if self.scan_id is not None:
+            num_imgs += '+'
+        if (self.scan_root is not None
+                and self.key.startswith(self.scan_root + '/')):
+            # show the relative path to the root folder
+            img_name = self.key[len(self.scan_root) + 1:]
+        else:
+            img_name = self.img_name
+        if self.key in self.dup_groups:
+            group_idx, num_groups = self.dup_groups[self.key]
+            img_name += f'  (duplicates {group_idx + 1} / {num_groups})'
+        self.name_label.setText(
+            f'[{self.dirpos + 1:d} / {num_imgs}] {img_name}')
 
     def dir_browse(self, direction):
+        # browsing manually stops the playback
+        if self.player.playing:
+            self.player.stop()
         if len(self.img_list[self.img_list_idx]) > 1:
             self.dirpos += direction
             if self.dirpos > (len(self.img_list[self.img_list_idx]) - 1):
@@ -312,9 +1057,11 @@ class Canvas(QWidget):
         if self.qview_bg_color == 'white':
             self.qview_bg_color = 'gray'
             self.qscene.setBackgroundBrush(QtCore.Qt.gray)
+            self.mosaic.set_background(QtCore.Qt.gray)
         else:
             self.qview_bg_color = 'white'
             self.qscene.setBackgroundBrush(QtCore.Qt.white)
+            self.mosaic.set_background(QtCore.Qt.white)
 
 
 class MainWindow(QMainWindow):
@@ -342,10 +1089,13 @@ class MainWindow(QMainWindow):
         file_menu.addAction(actions.refresh(self))
         file_menu.addAction(actions.include_file_name(self))
         file_menu.addAction(actions.exclude_file_name(self))
+        file_menu.addAction(actions.sort_by_meta(self))
         file_menu.addAction(actions.history(self))
+        file_menu.addAction(actions.recursive(self))
 
         # Edit
-        edit_menu = menubar.addMenu('&Edit')  # noqa: F841
+        edit_menu = menubar.addMenu('&Edit')
+        edit_menu.addAction(actions.export_crops(self))
 
         # Draw
         draw_menu = menubar.addMenu('&Draw')  # noqa: F841
@@ -353,9 +1103,24 @@ class MainWindow(QMainWindow):
         # Compare
         compare_menu = menubar.addMenu('&Compare')
         compare_menu.addAction(actions.compare(self))
+        compare_menu.addAction(actions.find_duplicates(self))
 
         # View
         self.view_menu = menubar.addMenu('&View')
+        self.mosaic_action = actions.mosaic(self)
+        self.view_menu.addAction(self.mosaic_action)
+        self.view_menu.addAction(actions.lean_memory(self))
+        self.view_menu.addAction(actions.process_decoding(self))
+        self.diff_action = actions.diff_heatmap(self)
+        self.view_menu.addAction(self.diff_action)
+        self.view_menu.addAction(actions.set_diff_amplification(self))
+        pixel_values_action = actions.pixel_values(self)
+        # shown by default, it only takes effect at high zoom
+        pixel_values_action.setChecked(True)
+        self.view_menu.addAction(pixel_values_action)
+        self.view_menu.addAction(actions.playback(self))
+        self.view_menu.addAction(actions.set_playback_fps(self))
+        self.view_menu.addAction(actions.play_frames(self))
 
         # Help
         help_menu = menubar.addMenu('&Help')
@@ -377,10 +1142,24 @@ class MainWindow(QMainWindow):
 
     def init_statusbar(self):
         self.statusBar().showMessage('Welcome to HandyView.')
+        # busy indicator of the background listing and loading
+        self.busy_bar = QProgressBar(self)
+        self.busy_bar.setRange(0, 0)
+        self.busy_bar.setMaximumWidth(120)
+        self.busy_bar.hide()
+        self.statusBar().addPermanentWidget(self.busy_bar)
 
     def set_statusbar(self, text):
         self.statusBar().showMessage(text)
 
+    def set_busy(self, message):
+        """Show the busy indicator with a message, or hide it (None)."""
+        if message is None:
+            self.busy_bar.hide()
+        else:
+            self.busy_bar.show()
+            self.set_statusbar(f'{message} (Esc to cancel)')
+
     def init_central_window(self):
         self.canvas = Canvas(self)
         self.setCentralWidget(self.canvas)
@@ -398,22 +1177,25 @@ class MainWindow(QMainWindow):
         layout = QGridLayout()
         layout.addWidget(self.canvas.info_label, 0, 0, 1, 3)
         layout.addWidget(self.canvas.zoom_label, 1, 0, 1, 3)
-        layout.addWidget(self.canvas.mouse_pos_label, 2, 0, 1, 3)
+        layout.addWidget(self.canvas.fps_label, 2, 0, 1, 3)
+        layout.addWidget(self.canvas.mouse_pos_label, 3, 0, 1, 3)
         color_grid = QGridLayout()
         color_grid.addWidget(self.canvas.mouse_color_title, 0, 0, 1, 1)
         color_grid.addWidget(self.canvas.mouse_color_label, 0, 1, 1, 3)
         color_grid.addWidget(self.canvas.mouse_rgb_label, 1, 0, 1, 3)
-        layout.addLayout(color_grid, 3, 0, 1, 3)
-        layout.addWidget(HLine(), 4, 0, 1, 3)
-        layout.addWidget(self.canvas.selection_pos_label, 5, 0, 1, 3)
-        layout.addWidget(HLine(), 6, 0, 1, 3)
-        layout.addWidget(self.canvas.include_names_label, 7, 0, 1, 3)
-        layout.addWidget(self.canvas.exclude_names_label, 8, 0, 1, 3)
-        layout.addWidget(self.canvas.comparison_label, 9, 0, 1, 3)
+        layout.addLayout(color_grid, 4, 0, 1, 3)
+        layout.addWidget(HLine(), 5, 0, 1, 3)
+        layout.addWidget(self.canvas.selection_pos_label, 6, 0, 1, 3)
+        layout.addWidget(HLine(), 7, 0, 1, 3)
+        layout.addWidget(self.canvas.include_names_label, 8, 0, 1, 3)
+        layout.addWidget(self.canvas.exclude_names_label, 9, 0, 1, 3)
+        layout.addWidget(self.canvas.sort_label, 10, 0, 1, 3)
+        layout.addWidget(self.canvas.comparison_label, 11, 0, 1, 3)
+        layout.addWidget(self.canvas.memory_label, 12, 0, 1, 3)
 
         # for compact space
         blank_qlabel = QLabel()
-        layout.addWidget(blank_qlabel, 7, 0, 20, 3)
+        layout.addWidget(blank_qlabel, 8, 0, 20, 3)
         dockedWidget.setLayout(layout)
 
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, dock_info)
@@ -431,13 +1213,10 @@ class MainWindow(QMainWindow):
             history = '.'
         key, ok = QFileDialog.getOpenFileName(self, 'Select an image', history)
         if ok:
-            self.canvas.key = key
-            self.canvas.get_main_img_list()
-            self.canvas.show_image(init=True)
+            self.canvas.open_main(key)
 
     def refresh_img_list(self):
-        self.canvas.get_main_img_list()
-        self.canvas.show_image(init=False)
+        self.canvas.open_main(self.canvas.key, init=False)
         # TODO: update comparison image list
 
     def compare_folder(self):
@@ -453,75 +1232,142 @@ class MainWindow(QMainWindow):
         key, ok = QInputDialog().getItem(self, 'Open File History', 'History:',
                                          lines, 0, True)
         if ok:
-            self.canvas.key = key
-            self.canvas.get_main_img_list()
-            self.canvas.show_image(init=True)
+            self.canvas.open_main(key)
+
+    def sort_by_meta(self):
+        items = ['name'] + list(META_FIELDS)
+        items += [f'{item} (descending)' for item in items]
+        current = self.canvas.sort_by
+        if self.canvas.sort_reverse:
+            current += ' (descending)'
+        item, ok = QInputDialog.getItem(self, 'Sort', 'Sort by:', items,
+                                        items.index(current), False)
+        if ok:
+            sort_by = item.split(' ')[0]
+            self.canvas.set_sort(sort_by, item.endswith('(descending)'))
+            show_str = f'Sort: {item}'
+            self.canvas.sort_label.setText(show_str)
+            if item != 'name':
+                self.canvas.sort_label.setStyleSheet('QLabel {color : blue;}')
+            else:
+                self.canvas.sort_label.setStyleSheet('QLabel {color : black;}')
 
-    def exclude_file_name(self):
-        # show current exclude names as the default values
-        current_exclude_names = self.canvas.exclude_names
-        if current_exclude_names is None:
-            current_exclude_names = ''
-        else:
-            current_exclude_names = ', '.join(current_exclude_names)
+    def find_duplicates(self):
+        hash_type, ok = QInputDialog.getItem(self, 'Find duplicates',
+                                             'Perceptual hash:', HASH_TYPES,
+                                             HASH_TYPES.index('phash'), False)
+        if not ok:
+            return
+        radius, ok = QInputDialog.getInt(
+            self, 'Find duplicates',
+            'Max Hamming distance (0 for exact duplicates):', 4, 0, 32)
+        if ok:
+            self.canvas.find_duplicates(hash_type, radius)
 
-        exclude_names, ok = QInputDialog.getText(self, 'Exclude file name',
-                                                 'Key word (seperate by ,):',
-                                                 QLineEdit.Normal,
-                                                 current_exclude_names)
+    def export_crops(self):
+        rect = self.canvas.qview.selection_rect
+        if rect is None:
+            show_msg('Information', 'Export crops',
+                     'Please select a rect with Shift + mouse drag first.')
+            return
+        save_folder = QFileDialog.getExistingDirectory(
+            self, 'Select a folder to save crops')
+        if save_folder == '':
+            return
+        scale, ok = QInputDialog.getInt(self, 'Export crops',
+                                        'Upscale ratio (nearest neighbour):',
+                                        1, 1, 64)
         if ok:
-            if exclude_names != '':
-                self.canvas.exclude_names = [
-                    v.strip() for v in exclude_names.split(',')
-                ]
-                self.canvas.include_names = None
-            else:
-                self.canvas.exclude_names = None
-            self.refresh_img_list()
-
-        # show exclude names in the information panel
-        if isinstance(self.canvas.exclude_names, list):
-            show_str = 'Exclude:\n\t' + '\n\t'.join(self.canvas.exclude_names)
-            self.canvas.exclude_names_label.setStyleSheet(
-                'QLabel {color : red;}')
-        else:
-            show_str = 'Exclude: None'
-            self.canvas.exclude_names_label.setStyleSheet(
-                'QLabel {color : black;}')
-        self.canvas.exclude_names_label.setText(show_str)
+            self.canvas.export_crops(save_folder, scale)
+
+    def toggle_recursive(self, checked):
+        self.canvas.recursive = checked
+        self.refresh_img_list()
+
+    def toggle_mosaic(self, checked):
+        self.canvas.set_mosaic_mode(checked)
+
+    def toggle_lean_memory(self, checked):
+        self.canvas.set_lean_memory(checked)
+
+    def toggle_process_decoding(self, checked):
+        self.canvas.set_process_decoding(checked)
+
+    def toggle_diff_heatmap(self, checked):
+        self.canvas.set_diff_mode(checked)
+
+    def set_diff_amplification(self):
+        amplification, ok = QInputDialog.getDouble(
+            self, 'Heatmap Amplification', 'Amplification:',
+            self.canvas.diff_amplification, 0.125, 1024, 3)
+        if ok:
+            self.canvas.set_diff_amplification(amplification)
+
+    def toggle_pixel_values(self, checked):
+        self.canvas.set_show_pixel_values(checked)
+
+    def toggle_playback(self):
+        self.canvas.player.toggle()
+
+    def toggle_animation(self):
+        self.canvas.animation.toggle()
+
+    def set_playback_fps(self):
+        fps, ok = QInputDialog.getInt(self, 'Playback FPS', 'Target FPS:',
+                                      self.canvas.player.fps, 1, 240)
+        if ok:
+            self.canvas.player.set_fps(fps)
+
+    def exclude_file_name(self):
+        self.set_filter_terms(exclude=True)
 
     def include_file_name(self):
-        # show current include names as the default values
-        current_include_names = self.canvas.include_names
-        if current_include_names is None:
-            current_include_names = ''
+        self.set_filter_terms(exclude=False)
+
+    def set_filter_terms(self, exclude=False):
+        """Set include or exclude terms. Include and exclude terms can be
+        used together."""
+        img_filter = self.canvas.img_filter
+        mode = 'Exclude' if exclude else 'Include'
+        # show current terms as the default values
+        if exclude:
+            terms = img_filter.exclude_terms
         else:
-            current_include_names = ', '.join(current_include_names)
-
-        include_names, ok = QInputDialog.getText(self, 'Include file name',
-                                                 'Key word (seperate by ,):',
-                                                 QLineEdit.Normal,
-                                                 current_include_names)
+            terms = img_filter.include_terms
+        text, ok = QInputDialog.getText(
+            self, f'{mode} file name',
+            'Key words, globs (*_x4*), re:regex or predicates (width>=1024)'
+            '\n(seperate by ,):', QLineEdit.Normal, ', '.join(terms))
         if ok:
-            if include_names != '':
-                self.canvas.include_names = [
-                    v.strip() for v in include_names.split(',')
-                ]
-                self.canvas.exclude_names = None
+            terms = [v.strip() for v in text.split(',') if v.strip() != '']
+            try:
+                if exclude:
+                    img_filter = ImageFilter(img_filter.include_terms, terms)
+                else:
+                    img_filter = ImageFilter(terms, img_filter.exclude_terms)
+            except re.error as error:
+                show_msg('Warning', 'Warning!', f'Wrong regex: {error}')
+                return
+            self.canvas.set_img_filter(img_filter)
+            if self.canvas.img_list[self.canvas.img_list_idx]:
+                # the current image may be filtered out
+                self.canvas.key = self.canvas.img_list[
+                    self.canvas.img_list_idx][self.canvas.dirpos]
+                self.canvas.show_image(init=False)
+
+        # show include and exclude terms in the information panel
+        for terms, label, mode, color in [
+            (img_filter.include_terms, self.canvas.include_names_label,
+             'Include', 'blue'),
+            (img_filter.exclude_terms, self.canvas.exclude_names_label,
+             'Exclude', 'red')
+        ]:
+            if terms:
+                label.setText(f'{mode}:\n\t' + '\n\t'.join(terms))
+                label.setStyleSheet('QLabel {color : ' + color + ';}')
             else:
-                self.canvas.include_names = None
-            self.refresh_img_list()
-
-        # show include names in the information panel
-        if isinstance(self.canvas.include_names, list):
-            show_str = 'Include:\n\t' + '\n\t'.join(self.canvas.include_names)
-            self.canvas.include_names_label.setStyleSheet(
-                'QLabel {color : blue;}')
-        else:
-            show_str = 'Include: None'
-            self.canvas.include_names_label.setStyleSheet(
-                'QLabel {color : black;}')
-        self.canvas.include_names_label.setText(show_str)
+                label.setText(f'{mode}: None')
+                label.setStyleSheet('QLabel {color : black;}')
 
     def show_instruction_msg(self):
         instruct_text = r'''
@@ -536,6 +1382,14 @@ class MainWindow(QMainWindow):
         R : Reset zoom ration to 1
         Space : Next image
         Backspace: Previous image
+        P : Play/Stop the image list as frames
+        [ ] : Decrease/Increase the playback FPS
+        M : Show all the comparison folders in a mosaic
+        , . : Previous/Next frame of an animated GIF or multi-page TIFF
+        G : Play/Stop the frames of an animated GIF or multi-page TIFF
+        H : Show |main - comparison| as a heatmap
+        - = : Decrease/Increase the heatmap amplification
+        Esc : Cancel opening a folder
         '''
         instruct_text_cn = r'''
         鼠标滚轮 : 上一张/下一张 图像
@@ -549,6 +1403,14 @@ class MainWindow(QMainWindow):
         R : 重置放大比率为1
         Space : 下一张 图像
         Backspace: 上一张 图像
+        P : 以帧序列 播放/停止 图像列表
+        [ ] : 降低/提高 播放帧率
+        M : 以同步网格显示所有对比文件夹
+        , . : 动态 GIF 或多页 TIFF 的 上一帧/下一帧
+        G : 播放/停止 动态 GIF 或多页 TIFF
+        H : 以热力图显示 |主图 - 对比图|
+        - = : 降低/提高 热力图放大倍数
+        Esc : 取消打开文件夹
         '''
         msg = MessageDialog(self, instruct_text, instruct_text_cn)
         msg.setStyleSheet('QLabel{min-width:500 px; font-size: 20px;}')
@@ -556,23 +1418,12 @@ class MainWindow(QMainWindow):
         msg.exec_()
 
 
-def sizeof_fmt(size, suffix='B'):
-    """Get human readable file size.
-    Args:
-        size (int): File size.
-        suffix (str): Suffix. Default: 'B'.
-    Return:
-        str: Formated file siz.
-    """
-    for unit in ['', 'K', 'M', 'G', 'T', 'P', 'E', 'Z']:
-        if abs(size) < 1024.0:
-            return f'{size:3.1f} {unit}{suffix}'
-        size /= 1024.0
-    return f'{size:3.1f} Y{suffix}'
-
-
 if __name__ == '__main__':
+    import multiprocessing
     import platform
+
+    # process pools in the frozen application
+    multiprocessing.freeze_support()
     if platform.system() == 'Windows':
         # set the icon in the task bar
         import ctypes
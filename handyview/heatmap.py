@@ -0,0 +1,142 @@
+"""
+Difference heatmap of the main and comparison images, i.e.,
+|main - comparison| with a colormap and an adjustable amplification.
+
+The heatmap is computed with numpy from the decoded images, by tiles and
+only for the exposed tiles. The absolute differences of each tile are kept,
+so that changing the amplification only applies the colormap again.
+"""
+import numpy as np
+from decoders import array_to_qimage
+from pixel_values import PIXEL_VALUE_ZOOM, draw_values, get_region, read_region
+from PyQt5.QtCore import QRect, QRectF
+from PyQt5.QtGui import QPixmap
+from tiles import TiledItem
+
+# anchor colors of the colormap (similar to inferno), from small to large
+_COLORMAP_ANCHORS = np.array(
+    [[0, 0, 4], [87, 16, 110], [188, 55, 84], [249, 142, 9], [252, 255, 164]],
+    np.float32)
+
+
+def get_colormap(anchors=_COLORMAP_ANCHORS):
+    """Interpolate the anchor colors to a lookup table.
+
+    Returns:
+        ndarray: uint8 array with shape (256, 3).
+    """
+    positions = np.linspace(0, 255, len(anchors))
+    lut = [
+        np.interp(np.arange(256), positions, anchors[:, i]) for i in range(3)
+    ]
+    return np.stack(lut, axis=1).round().astype(np.uint8)
+
+
+COLORMAP = get_colormap()
+
+
+def get_channel_diff(main_qimg, cmp_qimg, box):
+    """Absolute RGB differences in a box (left, top, right, bottom).
+
+    Returns:
+        ndarray: uint8 array with shape (h, w, 3).
+    """
+    main = read_region(main_qimg, *box)[..., :3].astype(np.int16)
+    comparison = read_region(cmp_qimg, *box)[..., :3].astype(np.int16)
+    return np.abs(main - comparison).astype(np.uint8)
+
+
+def get_abs_diff(main_qimg, cmp_qimg, rect):
+    """Sum of the absolute RGB differences in a rect.
+
+    Returns:
+        ndarray: uint16 array in [0, 765] with shape (h, w).
+    """
+    box = (rect.left(), rect.top(), rect.right() + 1, rect.bottom() + 1)
+    return get_channel_diff(main_qimg, cmp_qimg, box).sum(
+        axis=2, dtype=np.uint16)
+
+
+def apply_colormap(abs_diff, amplification):
+    """Colormap the mean absolute difference multiplied by amplification.
+
+    Returns:
+        ndarray: uint8 RGB array with shape (h, w, 3).
+    """
+    scale = amplification / 3
+    idx = np.clip(abs_diff * scale, 0, 255).astype(np.uint8)
+    return COLORMAP[idx]
+
+
+class HeatmapItem(TiledItem):
+    """Difference heatmap item drawn by tiles.
+
+    Only the overlapping region of the two images is drawn.
+
+    Args:
+        main_qimg (QImage): Main image.
+        cmp_qimg (QImage): Comparison image.
+        amplification (float): Amplification of the differences.
+            Default: 1.
+        tile_size (int): Tile size. Default: 512.
+    """
+
+    def __init__(self, main_qimg, cmp_qimg, amplification=1, tile_size=512):
+        super(HeatmapItem, self).__init__(tile_size)
+        self.main_qimg = main_qimg
+        self.cmp_qimg = cmp_qimg
+        self.amplification = amplification
+        self.rect = QRect(0, 0, min(main_qimg.width(), cmp_qimg.width()),
+                          min(main_qimg.height(), cmp_qimg.height()))
+        # tile index -> absolute differences
+        self.diffs = {}
+
+    def render_tile(self, tile_x, tile_y, rect):
+        abs_diff = self.diffs.get((tile_x, tile_y))
+        if abs_diff is None:
+            abs_diff = get_abs_diff(self.main_qimg, self.cmp_qimg, rect)
+            self.diffs[(tile_x, tile_y)] = abs_diff
+        return QPixmap.fromImage(
+            array_to_qimage(apply_colormap(abs_diff, self.amplification)))
+
+    def draw_pixel_values(self, painter, rect, zoom):
+        """Draw the absolute RGB differences inside the pixels, when the
+        zoom ratio is large enough. See pixel_values.draw_pixel_values."""
+        if zoom < PIXEL_VALUE_ZOOM:
+            return
+        region = get_region(self.main_qimg,
+                            rect.intersected(QRectF(self.rect)))
+        if region is None:
+            return
+        values = get_channel_diff(self.main_qimg, self.cmp_qimg, region)
+        colors = apply_colormap(
+            values.sum(axis=2, dtype=np.uint16), self.amplification)
+        luma = colors @ np.array([0.299, 0.587, 0.114])
+        draw_values(painter, region, values, luma, zoom)
+
+    def get_pixel(self, x_pos, y_pos):
+        """Get the absolute RGB differences and the heatmap color of a pixel.
+
+        Returns:
+            tuple | None: (differences, color), both are tuple[int] with
+                length 3. None if the pixel is out of the heatmap.
+        """
+        x_pos, y_pos = int(x_pos), int(y_pos)
+        if not self.rect.contains(x_pos, y_pos):
+            return None
+        diff = get_channel_diff(self.main_qimg, self.cmp_qimg,
+                                (x_pos, y_pos, x_pos + 1, y_pos + 1))[0, 0]
+        color = apply_colormap(diff.sum(dtype=np.uint16), self.amplification)
+        return tuple(diff.tolist()), tuple(color.tolist())
+
+    def set_amplification(self, amplification):
+        """Change the amplification. The differences are not computed again.
+        """
+        self.amplification = amplification
+        self.clear_tiles()
+
+    @property
+    def tile_bytes(self):
+        """Bytes of the cached differences and tiles."""
+        return (sum(diff.nbytes for diff in self.diffs.values()) +
+                super(HeatmapItem, self).tile_bytes)
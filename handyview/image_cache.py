@@ -0,0 +1,70 @@
+"""
+In-memory cache of decoded images, shared by the single view, the mosaic and
+the difference heatmap, so that an image is decoded only once.
+"""
+import threading
+from collections import OrderedDict
+
+
+def count_unique_bytes(qimgs, counted):
+    """Bytes of the images whose pixel buffers are not counted yet.
+
+    Shared buffers (e.g., the shown image that is also cached) have the same
+    QImage.cacheKey, and are counted only once.
+
+    Args:
+        qimgs (list[QImage]): Images.
+        counted (set[int]): Cache keys of the counted buffers. It is updated.
+
+    Returns:
+        int: Bytes of the buffers counted here.
+    """
+    num_bytes = 0
+    for qimg in qimgs:
+        cache_key = qimg.cacheKey()
+        if cache_key not in counted:
+            counted.add(cache_key)
+            num_bytes += qimg.sizeInBytes()
+    return num_bytes
+
+
+class ImageCache:
+    """Thread-safe LRU cache of decoded QImages, bounded by bytes.
+
+    Args:
+        max_bytes (int): Max bytes of the cached images. The latest image is
+            always kept. Default: 512 MB.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.num_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            qimg = self.images.get(key)
+            if qimg is not None:
+                self.images.move_to_end(key)
+            return qimg
+
+    def put(self, key, qimg):
+        with self.lock:
+            if key in self.images:
+                self.num_bytes -= self.images.pop(key).sizeInBytes()
+            self.images[key] = qimg
+            self.num_bytes += qimg.sizeInBytes()
+            while self.num_bytes > self.max_bytes and len(self.images) > 1:
+                _, old_qimg = self.images.popitem(last=False)
+                self.num_bytes -= old_qimg.sizeInBytes()
+
+    @property
+    def cached_images(self):
+        with self.lock:
+            return list(self.images.values())
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.num_bytes = 0
@@ -0,0 +1,144 @@
+"""
+Image metadata (mtime, file size, width, height and color mode) for sorting
+and filtering.
+
+Width, height and color mode come from header-only probes, i.e., the pixels
+are never decoded. Probes run on a background pool and the results are cached
+in the directory index.
+"""
+import operator
+import re
+import threading
+from archive import get_stat
+from cache import get_dir_index, save_dir_indexes, split_folder
+from concurrent.futures import ThreadPoolExecutor
+from decoders import probe
+from PyQt5 import QtCore
+
+META_FIELDS = ('mtime', 'size', 'width', 'height', 'mode')
+
+_OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '!=': operator.ne,
+    '==': operator.eq,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq
+}
+_PREDICATE_PATTERN = re.compile(r'^\s*(' + '|'.join(META_FIELDS) + r')\s*(' +
+                                '|'.join(_OPERATORS) + r')\s*(\S+)\s*$')
+
+
+def probe_header(key):
+    """Probe metadata of an image from its file header.
+
+    Returns:
+        dict: Metadata with META_FIELDS.
+    """
+    size, mtime = get_stat(key)
+    header = probe(key)
+    return dict(
+        mtime=mtime,
+        size=size,
+        width=header['width'],
+        height=header['height'],
+        mode=header['mode'])
+
+
+def get_meta(key):
+    """Get metadata of an image, from the directory index if possible.
+
+    Returns:
+        dict | None: Metadata. None if the image cannot be probed.
+    """
+    folder, name = split_folder(key)
+    try:
+        stat = get_stat(key)
+    except (OSError, KeyError):
+        return None
+    index = get_dir_index(folder)
+    meta = index.get(name, 'meta', stat)
+    if meta is None:
+        try:
+            meta = probe_header(key)
+        except Exception:
+            # broken or unsupported image
+            return None
+        index.set(name, 'meta', meta, stat)
+    return meta
+
+
+def parse_predicate(text):
+    """Parse a metadata predicate, e.g., 'width>=1024' or 'mode==RGB'.
+
+    Returns:
+        tuple | None: (field, operator function, value). None if the text is
+            not a metadata predicate.
+    """
+    match = _PREDICATE_PATTERN.match(text)
+    if match is None:
+        return None
+    field, op, value = match.groups()
+    if field != 'mode':
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    return field, _OPERATORS[op], value
+
+
+def check_predicates(meta, predicates):
+    """Whether the metadata satisfies all the predicates.
+
+    Images whose metadata is not probed yet (meta is None) are kept.
+    """
+    if meta is None:
+        return True
+    return all(op(meta[field], value) for field, op, value in predicates)
+
+
+class MetaProber(QtCore.QObject):
+    """Probe metadata on a background pool.
+
+    Signals:
+        probed (int, dict): Job id and a batch of {key: metadata}.
+    """
+    probed = QtCore.pyqtSignal(int, dict)
+
+    def __init__(self, parent=None, num_workers=8, chunk_size=64):
+        super(MetaProber, self).__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.chunk_size = chunk_size
+        self.job_id = 0
+        self.lock = threading.Lock()
+        self.num_pending = 0
+
+    def cancel(self):
+        """Cancel all the pending probes."""
+        self.job_id += 1
+        return self.job_id
+
+    def probe(self, keys):
+        """Probe keys in chunks. Results are emitted chunk by chunk."""
+        for i in range(0, len(keys), self.chunk_size):
+            with self.lock:
+                self.num_pending += 1
+            self.executor.submit(self.run_chunk, self.job_id,
+                                 keys[i:i + self.chunk_size])
+        return self.job_id
+
+    def run_chunk(self, job_id, keys):
+        try:
+            results = {}
+            for key in keys:
+                if job_id != self.job_id:
+                    return
+                results[key] = get_meta(key)
+            self.probed.emit(job_id, results)
+        finally:
+            with self.lock:
+                self.num_pending -= 1
+                all_done = self.num_pending == 0
+            if all_done:
+                save_dir_indexes()
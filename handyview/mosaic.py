@@ -0,0 +1,345 @@
+"""
+Synchronized mosaic of the image lists, i.e., the same position of the main
+and comparison folders side by side.
+
+All the panes share the zoom, the scroll position and the hover crosshair.
+They also share one decoding pool, and the decoded images are cached in the
+image cache of the canvas. Images are drawn by tiles, so that only the
+exposed tiles are redrawn when panning and zooming.
+Cached thumbnails (e.g., from the offline pre-indexer) are shown as
+placeholders until the images are decoded.
+"""
+import math
+import os
+from archive import split_key
+from concurrent.futures import ThreadPoolExecutor
+from decoders import load_qimage
+from pixel_values import draw_pixel_values
+from PyQt5 import QtCore
+from PyQt5.QtCore import QLineF, QPointF, QRect
+from PyQt5.QtGui import QColor, QImage, QPen, QTransform
+from PyQt5.QtWidgets import (QApplication, QGraphicsScene, QGraphicsView,
+                             QGridLayout, QWidget)
+from thumbnails import load_thumbnail
+from tiles import TiledImageItem
+from widgets import HVLable
+
+
+class MosaicView(QGraphicsView):
+    """One pane of the mosaic."""
+
+    def __init__(self, mosaic, pane_idx):
+        super(MosaicView, self).__init__(QGraphicsScene(mosaic), mosaic)
+        self.mosaic = mosaic
+        self.canvas = mosaic.canvas
+        self.pane_idx = pane_idx
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setResizeAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setMouseTracking(True)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setBackgroundBrush(self.mosaic.bg_brush)
+        self.item = None
+
+        self.horizontalScrollBar().valueChanged.connect(
+            lambda value: self.mosaic.sync_scroll(self))
+        self.verticalScrollBar().valueChanged.connect(
+            lambda value: self.mosaic.sync_scroll(self))
+
+    def set_image(self, qimg, full_size=None):
+        """Show an image in this pane.
+
+        Args:
+            qimg (QImage): Image. None to clear the pane.
+            full_size (tuple[int]): Full size (width, height) when qimg is a
+                thumbnail placeholder, which is stretched to the full size.
+                Default: None.
+        """
+        if qimg is None or qimg.isNull():
+            if self.item is not None:
+                self.scene().removeItem(self.item)
+                self.item = None
+            return
+        if self.item is None:
+            self.item = TiledImageItem(
+                qimg, cache_tiles=not self.mosaic.lean_memory)
+            self.scene().addItem(self.item)
+        else:
+            self.item.set_image(qimg)
+        if full_size is None:
+            self.item.setTransform(QTransform())
+        else:
+            self.item.setTransform(
+                QTransform.fromScale(full_size[0] / qimg.width(),
+                                     full_size[1] / qimg.height()))
+
+    def keyPressEvent(self, event):
+        # use canvas keyPressEvent for direction keys
+        self.canvas.keyPressEvent(event)
+
+    def wheelEvent(self, event):
+        mouse = event.angleDelta().y() / 120
+        modifiers = QApplication.keyboardModifiers()
+        if modifiers == QtCore.Qt.ControlModifier:
+            # When Ctrl pressed, zoom in/ out
+            if mouse > 0:
+                self.mosaic.set_zoom(self.mosaic.zoom * 1.05, self)
+            elif mouse < 0:
+                self.mosaic.set_zoom(self.mosaic.zoom / 1.05, self)
+        elif modifiers == QtCore.Qt.ShiftModifier:
+            QGraphicsView.wheelEvent(self, event)
+        else:
+            # Otherwise, show the next or previous image
+            if mouse > 0:
+                self.canvas.dir_browse(-1)
+            elif mouse < 0:
+                self.canvas.dir_browse(1)
+
+    def mouseMoveEvent(self, event):
+        QGraphicsView.mouseMoveEvent(self, event)
+        scene_pos = self.mapToScene(event.pos())
+        self.mosaic.set_cross(scene_pos)
+        self.show_mouse_info(scene_pos.x(), scene_pos.y())
+
+    def leaveEvent(self, event):
+        self.mosaic.set_cross(None)
+        QGraphicsView.leaveEvent(self, event)
+
+    def show_mouse_info(self, x_pos, y_pos):
+        """Show mouse position and color of this pane."""
+        self.canvas.mouse_pos_label.setText(
+            ('Cursor position:\n (ignore zoom)\n'
+             f' Height(y): {y_pos:.1f}\n Width(x):  {x_pos:.1f}'))
+        # the item is scaled when showing a thumbnail placeholder
+        item_pos = None if self.item is None else self.item.mapFromScene(
+            QPointF(x_pos, y_pos))
+        if item_pos is not None and self.item.qimg.valid(
+                int(item_pos.x()), int(item_pos.y())):
+            self.canvas.mouse_pos_label.setStyleSheet(
+                'QLabel {color : black;}')
+            pixel_color = QColor(
+                self.item.qimg.pixel(int(item_pos.x()), int(item_pos.y())))
+            self.canvas.mouse_color_label.fill(pixel_color)
+            rgba = pixel_color.getRgb()  # 8 bit RGBA
+            self.canvas.mouse_rgb_label.setText(
+                f' ({rgba[0]:3d}, {rgba[1]:3d}, {rgba[2]:3d}, '
+                f'{rgba[3]:3d})')
+        else:
+            self.canvas.mouse_pos_label.setStyleSheet('QLabel {color : red;}')
+
+    def update_cross(self, scene_pos):
+        """Only update the lines of the crosshair."""
+        if scene_pos is None:
+            return
+        pos = self.mapFromScene(scene_pos)
+        width, height = self.viewport().width(), self.viewport().height()
+        self.viewport().update(QRect(pos.x() - 2, 0, 5, height))
+        self.viewport().update(QRect(0, pos.y() - 2, width, 5))
+
+    def drawForeground(self, painter, rect):
+        # no pixel values for the thumbnail placeholders
+        if (self.canvas.show_pixel_values and self.item is not None
+                and self.item.transform().isIdentity()):
+            draw_pixel_values(painter, rect, self.item.qimg, self.mosaic.zoom)
+        scene_pos = self.mosaic.cross_pos
+        if scene_pos is None:
+            return
+        painter.save()
+        pen = QPen(QColor(255, 0, 0))
+        # one pixel width under any zoom
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        painter.drawLine(
+            QLineF(scene_pos.x(), rect.top(), scene_pos.x(), rect.bottom()))
+        painter.drawLine(
+            QLineF(rect.left(), scene_pos.y(), rect.right(), scene_pos.y()))
+        painter.restore()
+
+
+class MosaicWidget(QWidget):
+    """Grid of panes, one pane for each image list.
+
+    Args:
+        canvas (Canvas): The canvas with the image lists.
+        num_workers (int): Number of decoding workers. Default: 4.
+
+    Attributes:
+        lean_memory (bool): Whether to draw the cached images directly,
+            without tile pixmaps. Default: False.
+    """
+    # job id, pane index and the decoded image
+    loaded = QtCore.pyqtSignal(int, int, QImage)
+
+    def __init__(self, canvas, num_workers=4):
+        super(MosaicWidget, self).__init__(canvas)
+        self.canvas = canvas
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        # decoded images, shared with the canvas
+        self.cache = canvas.image_cache
+        self.loaded.connect(self.set_pane_image)
+        self.grid = QGridLayout(self)
+        self.grid.setSpacing(2)
+        self.views = []
+        self.name_labels = []
+        self.zoom = 1
+        self.cross_pos = None
+        self.bg_brush = QtCore.Qt.white
+        self.syncing = False
+        self.job_id = 0
+        self.last_pos = 0
+        self.lean_memory = False
+
+    def build_panes(self, num_panes):
+        for widget in self.views + self.name_labels:
+            self.grid.removeWidget(widget)
+            widget.deleteLater()
+        self.views = []
+        self.name_labels = []
+        num_cols = math.ceil(math.sqrt(num_panes))
+        for pane_idx in range(num_panes):
+            row, col = divmod(pane_idx, num_cols)
+            name_label = HVLable('', self, 'green', 'Times', 12)
+            view = MosaicView(self, pane_idx)
+            view.setTransform(QTransform().scale(self.zoom, self.zoom))
+            self.grid.addWidget(name_label, 2 * row, col)
+            self.grid.addWidget(view, 2 * row + 1, col)
+            self.name_labels.append(name_label)
+            self.views.append(view)
+
+    def show_position(self, img_lists, dirpos):
+        """Show the images at dirpos of all the image lists.
+
+        Cached images are shown at once, and the others are decoded in the
+        background. The next position in the browsing direction is decoded
+        ahead into the cache, except during playback, whose frames are
+        decoded ahead by the player and shared through the cache.
+        """
+        if len(img_lists) != len(self.views):
+            self.build_panes(len(img_lists))
+        self.job_id += 1
+        direction = -1 if dirpos < self.last_pos else 1
+        self.last_pos = dirpos
+        for pane_idx, img_list in enumerate(img_lists):
+            key = img_list[dirpos] if dirpos < len(img_list) else None
+            self.name_labels[pane_idx].setText(
+                f'{pane_idx}: {self.get_folder_name(key)}')
+            qimg = None if key is None else self.cache.get(key)
+            if key is None or qimg is not None:
+                self.set_pane_image(self.job_id, pane_idx, qimg)
+                continue
+            # show the cached thumbnail (if any) while decoding
+            thumb = load_thumbnail(key)
+            if thumb is not None:
+                self.set_pane_image(self.job_id, pane_idx, *thumb)
+            self.executor.submit(self.load, self.job_id, pane_idx, key)
+        if self.canvas.player.playing:
+            return
+        for img_list in img_lists:
+            if 0 <= dirpos + direction < len(img_list):
+                self.executor.submit(self.load, self.job_id, None,
+                                     img_list[dirpos + direction])
+
+    @staticmethod
+    def get_folder_name(key):
+        if key is None:
+            return 'None'
+        archive_path, member = split_key(key)
+        folder = archive_path or os.path.dirname(key)
+        return f'{os.path.basename(folder)}/{os.path.basename(member)}'
+
+    def load(self, job_id, pane_idx, key):
+        """Decode an image on the pool. pane_idx is None for decoding ahead.
+        """
+        if job_id != self.job_id:
+            # the position is changed
+            return
+        qimg = self.cache.get(key)
+        if qimg is None:
+            decoder = self.canvas.process_decoder
+            try:
+                if decoder is not None:
+                    qimg = decoder.decode(key)
+                else:
+                    qimg = load_qimage(key)
+            except Exception:
+                qimg = QImage()
+            if not qimg.isNull():
+                self.cache.put(key, qimg)
+        if pane_idx is not None:
+            self.loaded.emit(job_id, pane_idx, qimg)
+
+    def set_pane_image(self, job_id, pane_idx, qimg, full_size=None):
+        if job_id != self.job_id or pane_idx >= len(self.views):
+            return
+        self.views[pane_idx].set_image(qimg, full_size)
+        # the same scene rect for all the panes, so that their scroll bars
+        # are aligned
+        rects = [v.item.sceneBoundingRect() for v in self.views if v.item]
+        width = max([rect.width() for rect in rects] + [0])
+        height = max([rect.height() for rect in rects] + [0])
+        self.syncing = True
+        for view in self.views:
+            view.setSceneRect(0, 0, width, height)
+        self.syncing = False
+        self.sync_scroll(self.views[0])
+        self.canvas.update_memory_label()
+
+    def sync_scroll(self, source):
+        """Scroll the other panes to the scroll position of source."""
+        if self.syncing:
+            return
+        self.syncing = True
+        h_value = source.horizontalScrollBar().value()
+        v_value = source.verticalScrollBar().value()
+        for view in self.views:
+            if view is not source:
+                view.horizontalScrollBar().setValue(h_value)
+                view.verticalScrollBar().setValue(v_value)
+        self.syncing = False
+
+    def set_zoom(self, ratio, source=None):
+        """Zoom all the panes. The zoom is anchored in the source pane."""
+        self.zoom = ratio
+        # keep the single view in step
+        self.canvas.qview.zoom = ratio
+        self.canvas.zoom_label.setText(f'Zoom: {self.zoom:.2f}')
+        if not self.views:
+            return
+        source = source or self.views[0]
+        self.syncing = True
+        for view in [source] + [v for v in self.views if v is not source]:
+            view.setTransform(QTransform().scale(ratio, ratio))
+        self.syncing = False
+        self.sync_scroll(source)
+
+    def zoom_in(self):
+        self.set_zoom(self.zoom * 1.05)
+
+    def zoom_out(self):
+        self.set_zoom(self.zoom / 1.05)
+
+    def set_cross(self, scene_pos):
+        """Move the hover crosshair in all the panes."""
+        old_pos = self.cross_pos
+        self.cross_pos = None if scene_pos is None else QtCore.QPointF(
+            scene_pos)
+        for view in self.views:
+            view.update_cross(old_pos)
+            view.update_cross(self.cross_pos)
+
+    def set_lean_memory(self, lean_memory):
+        self.lean_memory = lean_memory
+        for view in self.views:
+            if view.item is not None:
+                view.item.set_cache_tiles(not lean_memory)
+
+    @property
+    def resident_bytes(self):
+        """Bytes of the tiles of the panes."""
+        return sum(view.item.tile_bytes for view in self.views
+                   if view.item is not None)
+
+    def set_background(self, brush):
+        self.bg_brush = brush
+        for view in self.views:
+            view.setBackgroundBrush(brush)
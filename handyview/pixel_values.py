@@ -0,0 +1,138 @@
+"""
+Draw the numeric value inside each visible pixel at high zoom, e.g., for
+checking the artifacts of super-resolution results pixel by pixel.
+
+Only the pixels in the exposed rect (clipped to the image) are read, with one
+region copy of the image, so the paint cost is bounded by the viewport
+instead of the image size.
+"""
+import math
+import numpy as np
+from PyQt5 import QtCore
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QColor, QImage, QPen, qBlue, qGreen, qRed
+
+# min zoom ratio to show the pixel values
+PIXEL_VALUE_ZOOM = 20
+# Format_Grayscale16 is only in newer Qt versions
+_GRAY_FORMATS = tuple(
+    getattr(QImage, name)
+    for name in ('Format_Grayscale8', 'Format_Grayscale16')
+    if hasattr(QImage, name))
+
+
+def get_region(qimg, rect):
+    """Get the pixel region of an image covered by a rect.
+
+    Returns:
+        tuple[int] | None: (left, top, right, bottom), None if the rect does
+            not cover any pixel.
+    """
+    left = max(0, math.floor(rect.left()))
+    top = max(0, math.floor(rect.top()))
+    right = min(qimg.width(), math.ceil(rect.right()))
+    bottom = min(qimg.height(), math.ceil(rect.bottom()))
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right, bottom
+
+
+def read_region(qimg, left, top, right, bottom):
+    """Read the 8-bit RGBA values of an image region at once.
+
+    Returns:
+        ndarray: uint8 array with shape (h, w, 4).
+    """
+    width, height = right - left, bottom - top
+    region = qimg.copy(left, top, width,
+                       height).convertToFormat(QImage.Format_RGBA8888)
+    ptr = region.constBits()
+    ptr.setsize(region.sizeInBytes())
+    arr = np.frombuffer(ptr, np.uint8).reshape(height, region.bytesPerLine())
+    return arr[:, :width * 4].reshape(height, width, 4).copy()
+
+
+def is_gray_format(qimg):
+    """Whether an image has only gray pixels, judged from its format.
+
+    QImage.isGrayscale scans all the pixels of 24/32-bit images, which is
+    too slow in each paint of large images.
+    """
+    if qimg.format() in _GRAY_FORMATS:
+        return True
+    if qimg.format() in (QImage.Format_Indexed8, QImage.Format_Mono,
+                         QImage.Format_MonoLSB):
+        return all(
+            qRed(color) == qGreen(color) == qBlue(color)
+            for color in qimg.colorTable())
+    return False
+
+
+def draw_pixel_values(painter, rect, qimg, zoom):
+    """Draw the pixel values in a rect, when the zoom ratio is large enough.
+
+    Gray images show one value, and images without alpha show RGB values.
+
+    Args:
+        painter (QPainter): Painter in the scene coordinates, where one
+            pixel is one unit, e.g., in drawForeground.
+        rect (QRectF): Exposed rect in the scene coordinates.
+        qimg (QImage): Shown image at the scene origin.
+        zoom (float): Zoom ratio of the view.
+    """
+    if zoom < PIXEL_VALUE_ZOOM or qimg is None or qimg.isNull():
+        return
+    region = get_region(qimg, rect)
+    if region is None:
+        return
+    values = read_region(qimg, *region)
+    luma = values[..., :3] @ np.array([0.299, 0.587, 0.114])
+    if is_gray_format(qimg):
+        values = values[..., :1]
+    elif not qimg.hasAlphaChannel():
+        values = values[..., :3]
+    draw_values(painter, region, values, luma, zoom)
+
+
+def draw_values(painter, region, values, luma, zoom):
+    """Draw values inside the pixels of a region.
+
+    Args:
+        painter (QPainter): Painter in the scene coordinates.
+        region (tuple[int]): (left, top, right, bottom) from get_region.
+        values (ndarray): Values with shape (h, w, lines) of the region.
+        luma (ndarray): Luma of the drawn pixels with shape (h, w), for the
+            text color.
+        zoom (float): Zoom ratio of the view.
+    """
+    left, top, right, bottom = region
+    num_lines = values.shape[2]
+
+    # pixel centers in the device coordinates, so that the text is not
+    # scaled by the zoom
+    transform = painter.transform()
+    grid_y, grid_x = np.mgrid[top:bottom, left:right] + 0.5
+    center_x = (
+        transform.m11() * grid_x + transform.m21() * grid_y + transform.dx())
+    center_y = (
+        transform.m12() * grid_x + transform.m22() * grid_y + transform.dy())
+
+    painter.save()
+    painter.resetTransform()
+    font = painter.font()
+    # fit the lines in height, and three digits in width
+    font.setPixelSize(max(1, int(min(zoom / (num_lines + 0.5), zoom / 2.2))))
+    painter.setFont(font)
+    # white text on dark pixels, black text on bright pixels
+    pens = (QPen(QColor(0, 0, 0)), QPen(QColor(255, 255, 255)))
+    dark = (luma < 128).tolist()
+    texts = values.tolist()
+    center_x, center_y = center_x.tolist(), center_y.tolist()
+    for row in range(bottom - top):
+        for col in range(right - left):
+            painter.setPen(pens[dark[row][col]])
+            painter.drawText(
+                QRectF(center_x[row][col] - zoom / 2,
+                       center_y[row][col] - zoom / 2, zoom, zoom),
+                QtCore.Qt.AlignCenter, '\n'.join(map(str, texts[row][col])))
+    painter.restore()
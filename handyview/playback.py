@@ -0,0 +1,222 @@
+"""
+Play the image list as a frame sequence, e.g., video frames or training
+snapshots.
+
+Frames are decoded ahead by worker threads into a bounded ring buffer. When
+decoding cannot keep up with the target FPS, late frames are dropped and the
+decoding stride is enlarged, so that the playback stays in time.
+"""
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from decoders import load_qimage
+from PyQt5 import QtCore
+
+
+class FramePlayer(QtCore.QObject):
+    """Frame-sequence player for the image lists of a canvas.
+
+    Each buffer slot holds the decoded frames of the same position for all
+    the image lists (main and comparison folders), so that switching folders
+    during playback stays in step.
+
+    Args:
+        canvas (Canvas): The canvas to show frames.
+        fps (float): Target FPS. Default: 25.
+        buffer_size (int): Max number of decoded images in the ring buffer.
+            Default: 32.
+        num_workers (int): Number of decoding workers. Default: 4.
+    """
+
+    def __init__(self, canvas, fps=25, buffer_size=32, num_workers=4):
+        super(FramePlayer, self).__init__(canvas)
+        self.canvas = canvas
+        self.fps = fps
+        self.buffer_size = buffer_size
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+
+        # ring buffer of (position, {list_idx: future of QImage})
+        self.ring = deque()
+        # timestamps of shown frames, used for the achieved FPS
+        self.shown_times = deque()
+        # moving average of the decoding time of one image, in seconds
+        self.decode_time = None
+        self.num_workers = num_workers
+        self.stride = 1
+        self.num_dropped = 0
+
+    @property
+    def playing(self):
+        return self.timer.isActive()
+
+    def toggle(self):
+        if self.playing:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        if len(self.canvas.img_list[self.canvas.img_list_idx]) < 2:
+            return
+        self.stride = 1
+        self.num_dropped = 0
+        self.shown_times.clear()
+        # positions are unwrapped, i.e., they keep increasing when looping
+        self.start_pos = self.canvas.dirpos
+        self.start_time = time.perf_counter()
+        self.next_pos = self.start_pos + 1
+        self.fill()
+        self.timer.start(max(1, int(1000 / self.fps)))
+
+    def stop(self):
+        self.timer.stop()
+        self.clear()
+        self.show_fps()
+
+    def clear(self):
+        for _, futures in self.ring:
+            for future in futures.values():
+                future.cancel()
+        self.ring.clear()
+
+    def set_fps(self, fps):
+        self.fps = max(1, fps)
+        if self.playing:
+            self.start()
+        else:
+            self.show_fps()
+
+    def invalidate(self):
+        """Drop the buffered frames, e.g., after the image lists change."""
+        if self.playing:
+            self.clear()
+            self.start()
+
+    def list_pos(self, list_idx, pos):
+        """Map an unwrapped position to the index of an image list."""
+        pos = pos % len(self.canvas.img_list[0])
+        return min(pos, len(self.canvas.img_list[list_idx]) - 1)
+
+    def fill(self):
+        """Fill the ring buffer with decoding jobs."""
+        num_lists = len(self.canvas.img_list)
+        max_slots = max(2, self.buffer_size // num_lists)
+        while len(self.ring) < max_slots:
+            futures = {}
+            for list_idx in range(num_lists):
+                key = self.canvas.img_list[list_idx][self.list_pos(
+                    list_idx, self.next_pos)]
+                if self.canvas.process_decoder is not None:
+                    future = self.canvas.process_decoder.submit(key)
+                else:
+                    future = self.executor.submit(self.decode, key)
+                futures[list_idx] = future
+            self.ring.append((self.next_pos, futures))
+            self.next_pos += self.stride
+
+    def decode(self, key):
+        tic = time.perf_counter()
+        qimg = load_qimage(key)
+        elapsed = time.perf_counter() - tic
+        if self.decode_time is None:
+            self.decode_time = elapsed
+        else:
+            self.decode_time = 0.9 * self.decode_time + 0.1 * elapsed
+        return qimg
+
+    def tick(self):
+        now = time.perf_counter()
+        expected_pos = self.start_pos + int((now - self.start_time) * self.fps)
+        list_idx = self.canvas.img_list_idx
+
+        # take the newest finished frame that is due. The due frames before
+        # it are dropped, and the due frames that are not decoded in time
+        # are also dropped.
+        shown = None
+        while self.ring and self.ring[0][0] <= expected_pos:
+            pos, futures = self.ring.popleft()
+            if futures[list_idx].done():
+                if shown is not None:
+                    self.num_dropped += 1
+                shown = (pos, futures)
+            else:
+                if self.ring and self.ring[0][0] <= expected_pos:
+                    # a later frame is also due, give up this one
+                    self.num_dropped += 1
+                    for future in futures.values():
+                        future.cancel()
+                else:
+                    # still wait for it
+                    self.ring.appendleft((pos, futures))
+                    break
+
+        if shown is not None:
+            pos, futures = shown
+            if self.canvas.mosaic_mode:
+                self.share_frames(pos, futures)
+            self.canvas.dirpos = self.list_pos(list_idx, pos)
+            self.canvas.key = self.canvas.img_list[list_idx][
+                self.canvas.dirpos]
+            self.canvas.show_image(qimg=futures[list_idx].result())
+            self.shown_times.append(now)
+
+        self.adapt_stride(now)
+        self.fill()
+        self.show_fps()
+
+    def share_frames(self, pos, futures):
+        """Put the decoded frames of a slot into the image cache of the
+        canvas, so that the mosaic panes do not decode them again."""
+        for list_idx, future in futures.items():
+            if not future.done() or future.cancelled():
+                continue
+            qimg = future.result()
+            if not qimg.isNull():
+                key = self.canvas.img_list[list_idx][self.list_pos(
+                    list_idx, pos)]
+                self.canvas.image_cache.put(key, qimg)
+
+    def adapt_stride(self, now):
+        """Skip frames in decoding when decoding cannot keep up."""
+        while self.shown_times and now - self.shown_times[0] > 1:
+            self.shown_times.popleft()
+        decoder = self.canvas.process_decoder
+        if decoder is not None:
+            num_workers, decode_time = decoder.num_workers, decoder.decode_time
+        else:
+            num_workers, decode_time = self.num_workers, self.decode_time
+        if not decode_time:
+            return
+        # the max number of positions that can be decoded per second, note
+        # that each position has one image for each image list
+        decode_fps = num_workers / (decode_time * len(self.canvas.img_list))
+        stride = max(1, math.ceil(self.fps / decode_fps))
+        # increase quickly and decrease slowly to avoid oscillation
+        if stride > self.stride:
+            self.stride = stride
+        elif stride < self.stride:
+            self.stride -= 1
+
+    @property
+    def resident_images(self):
+        """The decoded frames in the ring buffer."""
+        return [
+            future.result() for _, futures in list(self.ring)
+            for future in futures.values() if future.done()
+            and not future.cancelled() and future.exception() is None
+        ]
+
+    def show_fps(self):
+        if self.playing:
+            self.canvas.fps_label.setText(
+                f'Play: {len(self.shown_times):d} / {self.fps:g} FPS\n'
+                f' Stride: {self.stride:d}  Dropped: {self.num_dropped:d}')
+            self.canvas.fps_label.setStyleSheet('QLabel {color : red;}')
+        else:
+            self.canvas.fps_label.setText(f'Play: stopped ({self.fps:g} FPS)')
+            self.canvas.fps_label.setStyleSheet('QLabel {color : black;}')
@@ -0,0 +1,174 @@
+"""
+Offline pre-indexer, which fills the caches read by the viewer.
+
+It walks dataset trees (or archives) and precomputes the sorted listing of
+each folder, header metadata, thumbnails and optionally perceptual hashes.
+Run it after syncing a dataset (e.g., in a nightly job), so that the viewer
+opens the folders without listing or decoding them again.
+
+Usage:
+    python handyview/preindex.py ROOT [ROOT ...] [--hash] [--num_workers N]
+
+Images are processed on a process pool. Only the main process writes the
+directory indexes. Cached fields that are still valid are skipped.
+"""
+import argparse
+import os
+import sys
+import time
+from archive import get_reader, get_stat, is_archive
+from cache import get_dir_index, save_dir_indexes, split_folder
+from dedup import compute_hashes
+from itertools import repeat
+from metadata import probe_header
+from scanner import scan_tree
+from thumbnails import THUMB_SIZE, make_thumbnail
+from utils import new_process_pool
+
+
+def _index_worker(key, fields, thumb_size):
+    """Compute the missing index entries of an image in a worker process.
+
+    Returns:
+        tuple: Key, file stat and {field: value}. Failed fields are omitted,
+            and the stat is None if the image is removed.
+    """
+    try:
+        stat = get_stat(key)
+    except (OSError, KeyError):
+        return key, None, {}
+    values = {}
+    try:
+        if 'meta' in fields:
+            values['meta'] = probe_header(key)
+        if 'thumb' in fields:
+            values['thumb'] = make_thumbnail(key, thumb_size)
+        if 'hash' in fields:
+            values['hash'] = compute_hashes(key)
+    except Exception:
+        # broken or unsupported image, keep the fields done before
+        pass
+    return key, stat, values
+
+
+def get_keys(root):
+    """Get all the image keys under a folder recursively, or in an archive.
+
+    Listings of the folders are cached in the directory indexes.
+    """
+    if is_archive(root):
+        return get_reader(root).get_img_list()
+    return scan_tree(root)
+
+
+def get_jobs(keys, fields, force=False):
+    """Get the missing fields of each image.
+
+    Returns:
+        list[tuple[str, list[str]]]: Keys and their missing fields.
+    """
+    jobs = []
+    for key in keys:
+        try:
+            stat = get_stat(key)
+        except (OSError, KeyError):
+            continue
+        folder, name = split_folder(key)
+        index = get_dir_index(folder)
+        missing = [
+            field for field in fields
+            if force or index.get(name, field, stat) is None
+        ]
+        if missing:
+            jobs.append((key, missing))
+    return jobs
+
+
+def preindex(roots,
+             with_hash=False,
+             thumb_size=THUMB_SIZE,
+             num_workers=None,
+             force=False,
+             save_interval=256):
+    """Precompute the caches of dataset trees.
+
+    Args:
+        roots (list[str]): Folders or archives.
+        with_hash (bool): Whether to compute perceptual hashes.
+            Default: False.
+        thumb_size (int): Max side of thumbnails. 0 for no thumbnail.
+            Default: THUMB_SIZE.
+        num_workers (int): Number of processes. Default: None (CPU count).
+        force (bool): Recompute the fields that are still valid.
+            Default: False.
+        save_interval (int): Save the indexes every save_interval images, so
+            that an interrupted run keeps its progress. Default: 256.
+
+    Returns:
+        tuple[int, int, int]: Number of images, processed images and failed
+            images.
+    """
+    fields = ['meta']
+    if thumb_size:
+        fields.append('thumb')
+    if with_hash:
+        fields.append('hash')
+
+    keys = []
+    for root in roots:
+        keys.extend(get_keys(root))
+    jobs = get_jobs(keys, fields, force)
+    print(f'Found {len(keys)} images, {len(jobs)} to index.')
+    if not jobs:
+        return len(keys), 0, 0
+
+    num_failed = 0
+    with new_process_pool(num_workers) as executor:
+        results = executor.map(
+            _index_worker, [key for key, _ in jobs],
+            [missing for _, missing in jobs],
+            repeat(thumb_size),
+            chunksize=16)
+        for num_done, ((key, stat, values),
+                       (_, missing)) in enumerate(zip(results, jobs), 1):
+            if len(values) < len(missing):
+                num_failed += 1
+            if stat is not None:
+                folder, name = split_folder(key)
+                index = get_dir_index(folder)
+                for field, value in values.items():
+                    index.set(name, field, value, stat)
+            if num_done % save_interval == 0 or num_done == len(jobs):
+                save_dir_indexes()
+                print(f'Indexed {num_done}/{len(jobs)} images.')
+    return len(keys), len(jobs), num_failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('roots', type=str, nargs='+')
+    parser.add_argument(
+        '--hash', action='store_true', help='compute perceptual hashes')
+    parser.add_argument(
+        '--thumb_size',
+        type=int,
+        default=THUMB_SIZE,
+        help='max side of thumbnails, 0 for no thumbnail')
+    parser.add_argument('--num_workers', type=int, default=os.cpu_count())
+    parser.add_argument(
+        '--force', action='store_true', help='recompute the valid fields')
+    args = parser.parse_args()
+
+    for root in args.roots:
+        if not os.path.exists(root):
+            print(f'{root} does not exist.')
+            sys.exit(1)
+    tic = time.perf_counter()
+    _, _, num_failed = preindex(args.roots, args.hash, args.thumb_size,
+                                args.num_workers, args.force)
+    print(f'Done in {time.perf_counter() - tic:.1f} s, '
+          f'{num_failed} images failed.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Decode images on a process pool, and pass pixels back through shared memory.
+
+Decoding in Python threads is partly limited by the GIL. Here the decoding
+runs in worker processes. For each image, the main process allocates a
+shared memory block from the header (size and mode), the worker decodes into
+it, and the main process copies it into a QImage. Pixels are never pickled.
+"""
+import numpy as np
+import os
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from decoders import get_decoders, load_image, load_qimage, probe
+from multiprocessing import shared_memory
+from PyQt5.QtGui import QImage
+from utils import new_process_pool
+
+# decoded mode -> (number of channels, QImage format)
+_QIMAGE_FORMATS = {
+    'L': (1, QImage.Format_Grayscale8),
+    'RGB': (3, QImage.Format_RGB888),
+    'RGBA': (4, QImage.Format_RGBA8888)
+}
+
+
+def get_decode_mode(mode):
+    """Get the decoded mode from the mode in the header.
+
+    Returns:
+        str | None: 'L', 'RGB' or 'RGBA'. None for modes that are not
+            supported in shared memory, e.g., 16-bit images.
+    """
+    if mode in ('L', '1'):
+        return 'L'
+    if mode in ('RGB', 'YCbCr', 'CMYK'):
+        return 'RGB'
+    if mode in ('RGBA', 'LA', 'PA', 'P'):
+        # palette images may have transparency
+        return 'RGBA'
+    return None
+
+
+def _decode_worker(key, shm_name, shape, mode):
+    """Decode an image into a shared memory block in a worker process.
+
+    Returns:
+        float: Decoding time in seconds.
+    """
+    tic = time.perf_counter()
+    # spawned workers share the resource tracker of the main process, which
+    # owns and unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        img = load_image(key)
+        if img.mode != mode:
+            img = img.convert(mode)
+        arr = np.ndarray(shape, np.uint8, buffer=shm.buf)
+        arr[...] = np.asarray(img).reshape(shape)
+        del arr
+    finally:
+        shm.close()
+    return time.perf_counter() - tic
+
+
+def _set_result(future, qimg):
+    """Set the result unless the future is cancelled in the meantime."""
+    try:
+        future.set_result(qimg)
+    except InvalidStateError:
+        pass
+
+
+class ProcessDecoder:
+    """Decoder with a process pool and shared memory transfer.
+
+    Images in modes not supported in shared memory, or without a decoder to
+    PIL images, are decoded in threads with load_qimage.
+
+    Args:
+        num_workers (int): Number of processes. Default: None (CPU count).
+    """
+
+    def __init__(self, num_workers=None):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.executor = new_process_pool(self.num_workers)
+        # start the worker processes now, spawning them takes a while
+        for _ in range(self.num_workers):
+            self.executor.submit(int)
+        self.thread_executor = ThreadPoolExecutor(max_workers=2)
+        # moving average of the decoding time of one image, in seconds
+        self.decode_time = None
+        self.lock = threading.Lock()
+
+    def submit(self, key):
+        """Decode an image in the background.
+
+        The header is probed in a helper thread, so that submitting never
+        reads files on the caller's thread (e.g., the UI thread).
+
+        Returns:
+            concurrent.futures.Future: Future of the QImage. A null QImage if
+                it cannot be decoded, the same as load_qimage.
+        """
+        future = Future()
+        self.thread_executor.submit(self._start, key, future)
+        return future
+
+    def _start(self, key, future):
+        """Probe the header and start decoding on the process pool, in a
+        helper thread."""
+        if future.cancelled():
+            return
+        if not get_decoders(key, 'pil'):
+            _set_result(future, load_qimage(key))
+            return
+        try:
+            header = probe(key)
+        except Exception:
+            _set_result(future, QImage())
+            return
+        width, height = header['width'], header['height']
+        mode = get_decode_mode(header['mode'])
+        if mode is None:
+            _set_result(future, load_qimage(key))
+            return
+
+        channels, _ = _QIMAGE_FORMATS[mode]
+        shape = (height, width, channels)
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(1, width * height * channels))
+        worker_future = self.executor.submit(_decode_worker, key, shm.name,
+                                             shape, mode)
+        worker_future.add_done_callback(
+            lambda f: self._finish(f, future, shm, shape, mode))
+        # cancel the worker job together
+        future.add_done_callback(
+            lambda f: f.cancelled() and worker_future.cancel())
+
+    def _finish(self, worker_future, future, shm, shape, mode):
+        """Copy the decoded pixels into a QImage and free the shared memory.
+        """
+        try:
+            if future.cancelled() or worker_future.cancelled():
+                future.cancel()
+                return
+            elapsed = worker_future.result()
+            height, width, channels = shape
+            _, qimage_format = _QIMAGE_FORMATS[mode]
+            qimg = QImage(shm.buf, width, height, width * channels,
+                          qimage_format).copy()
+            with self.lock:
+                if self.decode_time is None:
+                    self.decode_time = elapsed
+                else:
+                    self.decode_time = 0.9 * self.decode_time + 0.1 * elapsed
+            _set_result(future, qimg)
+        except Exception:
+            _set_result(future, QImage())
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def decode(self, key):
+        """Decode an image and wait for it."""
+        return self.submit(key).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.thread_executor.shutdown(wait=False)
@@ -0,0 +1,202 @@
+"""
+Walk a dataset tree with parallel scandir workers.
+
+Directory listing is IO bound (especially on network filesystems), so a pool
+of threads can list many directories at the same time. Listings are cached in
+the directory index, and reused while the folder mtime is unchanged.
+"""
+import os
+import threading
+from cache import get_dir_index
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5 import QtCore
+from utils import is_image_file, natural_sort_key
+
+
+def list_dir(path):
+    """List the images and sub-folders of a folder.
+
+    The listing is read from the directory index if the folder is not changed
+    since it was cached, e.g., by the offline pre-indexer. All the file names
+    are cached, and the images are picked when reading, since the decodable
+    extensions depend on the installed decoders.
+
+    Returns:
+        tuple[list[str], list[str]]: Image names and sub-folder names, both
+            with natural sort.
+    """
+    mtime = os.stat(path).st_mtime
+    index = get_dir_index(path)
+    listing = index.get_listing(mtime)
+    if listing is None:
+        names, dirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                else:
+                    names.append(entry.name)
+        names.sort(key=natural_sort_key)
+        dirs.sort(key=natural_sort_key)
+        index.set_listing(names, dirs, mtime)
+        try:
+            index.save()
+        except OSError:
+            # the cache is optional, e.g., the cache folder is read-only
+            pass
+    else:
+        names, dirs = listing
+    return [name for name in names if is_image_file(name)], dirs
+
+
+def scan_tree(root,
+              img_filter=None,
+              callback=None,
+              num_workers=8,
+              cancel_event=None):
+    """Find all the images under a folder recursively.
+
+    Args:
+        root (str): Root folder.
+        img_filter (ImageFilter): Filter by names. Default: None.
+        callback (func): Called with a list of image paths (unsorted) once a
+            folder is listed. Note that it is called in worker threads.
+            Default: None.
+        num_workers (int): Number of scandir workers. Default: 8.
+        cancel_event (threading.Event): Stop walking when it is set.
+            Default: None.
+
+    Returns:
+        list[str]: Image paths with natural sort.
+    """
+    img_list = []
+    lock = threading.Lock()
+    all_done = threading.Event()
+    # number of folders submitted but not finished yet
+    num_pending = [0]
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    def submit(path):
+        with lock:
+            num_pending[0] += 1
+        executor.submit(scan_dir, path)
+
+    def scan_dir(path):
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            files, dirs = list_dir(path)
+            for name in dirs:
+                submit(os.path.join(path, name))
+            batch = [
+                os.path.join(path, name).replace('\\', '/') for name in files
+            ]
+            if img_filter is not None:
+                batch = [p for p in batch if img_filter.match_name(p)]
+            if batch:
+                with lock:
+                    img_list.extend(batch)
+                if callback is not None:
+                    callback(batch)
+        except OSError:
+            # e.g., permission denied, or the folder is removed
+            pass
+        finally:
+            with lock:
+                num_pending[0] -= 1
+                if num_pending[0] == 0:
+                    all_done.set()
+
+    submit(root)
+    all_done.wait()
+    executor.shutdown()
+    img_list.sort(key=natural_sort_key)
+    return img_list
+
+
+def sort_entries(paths):
+    """Natural sort of image paths, with the sort keys kept for merging.
+
+    Returns:
+        list[tuple]: Sorted (natural sort key, path).
+    """
+    return sorted((natural_sort_key(path), path) for path in paths)
+
+
+def find_first_image(root):
+    """Find the first image (with natural sort) under a folder recursively.
+
+    It only descends along the first branches, so that the first image can be
+    shown before walking the whole tree.
+    """
+    try:
+        with os.scandir(root) as entries:
+            entries = sorted(entries, key=lambda e: natural_sort_key(e.name))
+    except OSError:
+        return None
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            img_path = find_first_image(entry.path)
+            if img_path is not None:
+                return img_path
+        elif is_image_file(entry.name):
+            return entry.path.replace('\\', '/')
+    return None
+
+
+class DirScanner(QtCore.QObject):
+    """Walk a folder recursively in the background and stream the results.
+
+    Batches are sorted in the worker threads, so that the main thread only
+    merges them.
+
+    Signals:
+        found (int, list): Scan id and a batch of sorted (natural sort key,
+            image path), see sort_entries.
+        finished (int): Scan id.
+    """
+    found = QtCore.pyqtSignal(int, list)
+    finished = QtCore.pyqtSignal(int)
+
+    def __init__(self, parent=None, num_workers=8):
+        super(DirScanner, self).__init__(parent)
+        self.num_workers = num_workers
+        self.scan_id = 0
+        self.cancel_event = None
+
+    @property
+    def scanning(self):
+        return (self.cancel_event is not None
+                and not self.cancel_event.is_set())
+
+    def start(self, root, img_filter=None):
+        """Start a new scan, the previous one is cancelled.
+
+        Returns:
+            int: Scan id, used to ignore the results of previous scans.
+        """
+        self.cancel()
+        self.scan_id += 1
+        self.cancel_event = threading.Event()
+        threading.Thread(
+            target=self.run,
+            args=(self.scan_id, self.cancel_event, root, img_filter),
+            daemon=True).start()
+        return self.scan_id
+
+    def cancel(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def run(self, scan_id, cancel_event, root, img_filter):
+        scan_tree(
+            root,
+            img_filter,
+            callback=lambda batch: self.found.emit(scan_id, sort_entries(batch)
+                                                   ),
+            num_workers=self.num_workers,
+            cancel_event=cancel_event)
+        # signals are queued to the main thread, so finished always arrives
+        # after the last batch
+        self.finished.emit(scan_id)
+        cancel_event.set()
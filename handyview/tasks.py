@@ -0,0 +1,84 @@
+"""
+Run listing and loading work in the background, e.g., opening a folder on a
+slow network filesystem, so that the window never freezes.
+"""
+import threading
+from PyQt5 import QtCore
+
+
+class TaskCancelled(Exception):
+    """Raised in a task when it is cancelled."""
+
+
+class TaskRunner(QtCore.QObject):
+    """Run one task at a time in a background thread.
+
+    Starting a new task cancels the previous one. A blocking call (e.g.,
+    listing a folder) cannot be interrupted, but the results of a cancelled
+    task are always dropped, so it is aborted at once for the window.
+
+    A task function is called with the keyword arguments cancel_event
+    (threading.Event) and report (func, called with a progress message).
+    It may raise TaskCancelled to stop early.
+
+    Signals:
+        progress (int, str): Task id and a progress message.
+        finished (int, object): Task id and the result.
+        failed (int, str): Task id and the error message.
+    """
+    progress = QtCore.pyqtSignal(int, str)
+    finished = QtCore.pyqtSignal(int, object)
+    failed = QtCore.pyqtSignal(int, str)
+
+    def __init__(self, parent=None):
+        super(TaskRunner, self).__init__(parent)
+        self.task_id = 0
+        self.cancel_event = None
+
+    @property
+    def running(self):
+        return (self.cancel_event is not None
+                and not self.cancel_event.is_set())
+
+    def start(self, func, *args):
+        """Start a new task, the previous one is cancelled.
+
+        Returns:
+            int: Task id, used to ignore the results of previous tasks.
+        """
+        self.cancel()
+        self.task_id += 1
+        self.cancel_event = threading.Event()
+        threading.Thread(
+            target=self.run,
+            args=(self.task_id, self.cancel_event, func, args),
+            daemon=True).start()
+        return self.task_id
+
+    def cancel(self):
+        """Cancel the running task. Its results (even if already emitted)
+        are ignored, since the task id is changed."""
+        if self.running:
+            self.cancel_event.set()
+            self.task_id += 1
+
+    def run(self, task_id, cancel_event, func, args):
+
+        def report(message):
+            if cancel_event.is_set():
+                raise TaskCancelled
+            self.progress.emit(task_id, message)
+
+        try:
+            result = func(*args, cancel_event=cancel_event, report=report)
+        except TaskCancelled:
+            return
+        except Exception as error:
+            if not cancel_event.is_set():
+                cancel_event.set()
+                self.failed.emit(task_id, str(error))
+            return
+        if not cancel_event.is_set():
+            # set before emitting, so that running is False in the slot
+            cancel_event.set()
+            self.finished.emit(task_id, result)
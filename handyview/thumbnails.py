@@ -0,0 +1,70 @@
+"""
+Thumbnail cache shared by the viewer and the offline pre-indexer.
+
+Thumbnails are JPEG files in the cache folder. The directory index records
+the thumbnail of each image together with the full image size, so that a
+thumbnail is only used while the file size and mtime are unchanged.
+"""
+import hashlib
+import os
+from archive import get_stat
+from cache import get_cache_path, get_dir_index, split_folder
+from decoders import load_image, probe
+from PyQt5.QtGui import QImage
+
+THUMB_SIZE = 256
+
+
+def get_thumbnail_path(key):
+    """Get the thumbnail file path of an image."""
+    folder, name = split_folder(key)
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return os.path.join(
+        get_cache_path('thumbs', folder, ext=''), f'{digest}.jpg')
+
+
+def make_thumbnail(key, thumb_size=THUMB_SIZE):
+    """Write the thumbnail of an image.
+
+    It does not touch the directory index, so that it can run in worker
+    processes. The caller records the returned entry in the directory index
+    of the image under 'thumb', see preindex.py.
+
+    Args:
+        key (str): Image path or archive key.
+        thumb_size (int): Max side of the thumbnail. Default: THUMB_SIZE.
+
+    Returns:
+        dict: Thumbnail entry with the full image 'width' and 'height'.
+    """
+    # the reduced decoding does not know the full size
+    header = probe(key)
+    img = load_image(key, size=thumb_size)
+    img.thumbnail((thumb_size, thumb_size))
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    thumb_path = get_thumbnail_path(key)
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    img.save(thumb_path, 'JPEG', quality=90)
+    return dict(width=header['width'], height=header['height'])
+
+
+def load_thumbnail(key):
+    """Load the cached thumbnail of an image.
+
+    Returns:
+        tuple[QImage, tuple[int]] | None: Thumbnail and the full image size
+            (width, height). None if there is no valid thumbnail.
+    """
+    folder, name = split_folder(key)
+    try:
+        stat = get_stat(key)
+    except (OSError, KeyError):
+        return None
+    thumb = get_dir_index(folder).get(name, 'thumb', stat)
+    if thumb is None:
+        return None
+    qimg = QImage(get_thumbnail_path(key))
+    if qimg.isNull():
+        return None
+    return qimg, (thumb['width'], thumb['height'])
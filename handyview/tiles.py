@@ -0,0 +1,121 @@
+"""
+Graphics items drawn by tiles, so that only the exposed tiles are drawn when
+panning and zooming, and each tile is rendered only the first time it is
+exposed.
+"""
+from PyQt5.QtCore import QRect, QRectF
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QGraphicsItem
+
+
+def get_pixmap_bytes(qpixmap):
+    """Bytes of the pixel buffer of a QPixmap."""
+    return qpixmap.width() * qpixmap.height() * qpixmap.depth() // 8
+
+
+class TiledItem(QGraphicsItem):
+    """Base item drawn by tiles, with a cache of the rendered tiles.
+
+    Subclasses set self.rect (QRect), the region covered by the tiles, and
+    implement render_tile.
+
+    Args:
+        tile_size (int): Tile size. Default: 512.
+    """
+
+    def __init__(self, tile_size=512):
+        super(TiledItem, self).__init__()
+        self.tile_size = tile_size
+        self.rect = QRect()
+        # tile index -> rendered QPixmap
+        self.tiles = {}
+        # provide the exposed rect in paint
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QRectF(self.rect)
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.toAlignedRect().intersected(self.rect)
+        if exposed.isEmpty():
+            return
+        self.paint_tiles(painter, exposed)
+
+    def paint_tiles(self, painter, exposed):
+        """Draw the tiles intersecting the exposed rect."""
+        size = self.tile_size
+        for tile_y in range(exposed.top() // size,
+                            exposed.bottom() // size + 1):
+            for tile_x in range(exposed.left() // size,
+                                exposed.right() // size + 1):
+                tile = self.tiles.get((tile_x, tile_y))
+                if tile is None:
+                    rect = QRect(tile_x * size, tile_y * size, size,
+                                 size).intersected(self.rect)
+                    tile = self.render_tile(tile_x, tile_y, rect)
+                    self.tiles[(tile_x, tile_y)] = tile
+                painter.drawPixmap(tile_x * size, tile_y * size, tile)
+
+    def render_tile(self, tile_x, tile_y, rect):
+        """Render a tile.
+
+        Args:
+            tile_x (int): Tile index along x.
+            tile_y (int): Tile index along y.
+            rect (QRect): Region of the tile, clipped to self.rect.
+
+        Returns:
+            QPixmap: Rendered tile.
+        """
+        raise NotImplementedError
+
+    def clear_tiles(self):
+        """Drop the rendered tiles, and render them again when exposed."""
+        self.tiles = {}
+        self.update()
+
+    @property
+    def tile_bytes(self):
+        """Bytes of the cached tiles."""
+        return sum(get_pixmap_bytes(tile) for tile in self.tiles.values())
+
+
+class TiledImageItem(TiledItem):
+    """Image item drawn by tiles.
+
+    Each tile is converted to a QPixmap the first time it is exposed.
+
+    Without the tile cache, the exposed rect is drawn from the QImage
+    directly. It keeps only one pixel buffer, at the cost of converting the
+    pixels in each paint.
+
+    Args:
+        qimg (QImage): Image.
+        tile_size (int): Tile size. Default: 512.
+        cache_tiles (bool): Whether to cache tiles as QPixmaps.
+            Default: True.
+    """
+
+    def __init__(self, qimg, tile_size=512, cache_tiles=True):
+        super(TiledImageItem, self).__init__(tile_size)
+        self.cache_tiles = cache_tiles
+        self.set_image(qimg)
+
+    def set_image(self, qimg):
+        self.prepareGeometryChange()
+        self.qimg = qimg
+        self.rect = qimg.rect()
+        self.clear_tiles()
+
+    def paint_tiles(self, painter, exposed):
+        if not self.cache_tiles:
+            painter.drawImage(exposed, self.qimg, exposed)
+            return
+        super(TiledImageItem, self).paint_tiles(painter, exposed)
+
+    def render_tile(self, tile_x, tile_y, rect):
+        return QPixmap.fromImage(self.qimg.copy(rect))
+
+    def set_cache_tiles(self, cache_tiles):
+        self.cache_tiles = cache_tiles
+        self.clear_tiles()
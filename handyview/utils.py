@@ -0,0 +1,59 @@
+"""
+Utilities shared by the viewer and the image list builders.
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# lower-case extensions of the registered decoders, see decoders.py
+IMG_EXTENSIONS = set()
+
+
+def new_process_pool(num_workers=None):
+    """Create a process pool with the spawn start method.
+
+    Spawn is safer than fork in a multi-threaded GUI process, and behaves the
+    same on all the platforms. Worker functions must be importable at the
+    module level.
+
+    Args:
+        num_workers (int): Number of processes. Default: None (CPU count).
+    """
+    return ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context('spawn'))
+
+
+def is_image_file(path):
+    """Whether a path (or an archive member) has a decodable extension."""
+    return os.path.splitext(path)[1].lower() in IMG_EXTENSIONS
+
+
+def natural_sort_key(s):
+    """Key for natural sort, i.e., numbers in name are compared as numbers.
+
+    Args:
+        s (str): String to be sorted, e.g., image path.
+
+    Returns:
+        list: Sort key.
+    """
+    return [
+        int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', s)
+    ]
+
+
+def sizeof_fmt(size, suffix='B'):
+    """Get human readable file size.
+    Args:
+        size (int): File size.
+        suffix (str): Suffix. Default: 'B'.
+    Return:
+        str: Formated file siz.
+    """
+    for unit in ['', 'K', 'M', 'G', 'T', 'P', 'E', 'Z']:
+        if abs(size) < 1024.0:
+            return f'{size:3.1f} {unit}{suffix}'
+        size /= 1024.0
+    return f'{size:3.1f} Y{suffix}'
@@ -2,6 +2,7 @@
 We use the Graphics View Framework (https://doc.qt.io/qt-5/graphicsview.html)
 for our HandyView.
 """
+from pixel_values import draw_pixel_values
 from PyQt5 import QtCore
 from PyQt5.QtCore import QPoint, QRect, QSize
 from PyQt5.QtGui import QColor, QTransform
@@ -37,6 +38,8 @@ class HVView(QGraphicsView):
         # indicate whether rubber band could be changed under mouseMoveEvent
         self.rubber_band_changable = False
         self.rect_top_left = (0, 0)
+        # selection rect in the image coordinates: (left, top, right, bottom)
+        self.selection_rect = None
 
     def mousePressEvent(self, event):
         modifiers = QApplication.keyboardModifiers()
@@ -54,6 +57,7 @@ class HVView(QGraphicsView):
                 event.pos())  # convert to scene position
             x_scene, y_scene = scene_pos.x(), scene_pos.y()
             self.show_rect_position(x_scene, y_scene, x_scene, y_scene)
+            self.selection_rect = None
         else:
             QGraphicsView.mousePressEvent(self, event)
 
@@ -75,6 +79,8 @@ class HVView(QGraphicsView):
                 ori_x_scene, ori_y_scene = ori_scene_pos.x(), ori_scene_pos.y()
                 self.show_rect_position(ori_x_scene, ori_y_scene, x_scene,
                                         y_scene)
+                self.set_selection_rect(ori_x_scene, ori_y_scene, x_scene,
+                                        y_scene)
                 # Show rubber band
                 if self.rubber_band_changable:
                     self.rubber_band.setGeometry(
@@ -109,6 +115,16 @@ class HVView(QGraphicsView):
             elif mouse < 0:
                 self.parent.dir_browse(1)
 
+    def drawForeground(self, painter, rect):
+        if not self.parent.show_pixel_values:
+            return
+        if self.parent.heatmap_item is not None:
+            # the drawn pixels are the differences
+            self.parent.heatmap_item.draw_pixel_values(painter, rect,
+                                                       self.zoom)
+        else:
+            draw_pixel_values(painter, rect, self.parent.qimg, self.zoom)
+
     def show_mouse_position(self, x_pos, y_pos):
         """Show mouse position under the scene position (ignore the zoom)."""
         self.parent.mouse_pos_label.setText(
@@ -124,6 +140,8 @@ class HVView(QGraphicsView):
 
     def show_mouse_color(self, x_pos, y_pos):
         """Show mouse color with RGBA values."""
+        if self.parent.show_heatmap_pixel(x_pos, y_pos):
+            return
         pixel = self.parent.qimg.pixel(int(x_pos), int(y_pos))
         pixel_color = QColor(pixel)
         self.parent.mouse_color_label.fill(pixel_color)
@@ -151,6 +169,17 @@ class HVView(QGraphicsView):
             self.parent.selection_pos_label.setStyleSheet(
                 'QLabel {color : red;}')
 
+    def set_selection_rect(self, x_start, y_start, x_end, y_end):
+        """Record the selection rect, clipped to the image."""
+        left = max(0, int(min(x_start, x_end)))
+        top = max(0, int(min(y_start, y_end)))
+        right = min(self.parent.imgw, int(max(x_start, x_end)))
+        bottom = min(self.parent.imgh, int(max(y_start, y_end)))
+        if right > left and bottom > top:
+            self.selection_rect = (left, top, right, bottom)
+        else:
+            self.selection_rect = None
+
     def zoom_in(self):
         self.zoom *= 1.05
         self.parent.zoom_label.setText(f'Zoom: {self.zoom:.2f}')
@@ -210,6 +239,8 @@ class HVScene(QGraphicsScene):
 
     def show_mouse_color(self, x_pos, y_pos):
         """Show mouse color with RGBA values."""
+        if self.parent.show_heatmap_pixel(x_pos, y_pos):
+            return
         pixel = self.parent.qimg.pixel(int(x_pos), int(y_pos))
         pixel_color = QColor(pixel)
         self.parent.mouse_color_label.fill(pixel_color)